@@ -1,8 +1,25 @@
-import json
-from datetime import date
+import os
 
-import plotly.express as px
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import blob_store
+import database
+import instrumentation
+import lazy_imports
+import task_search
+from project_index import ProjectIndex
+
+# Heavy libraries load on first use, so the login screen renders with only streamlit loaded
+pd = lazy_imports.lazy("pandas")
+px = lazy_imports.lazy("plotly.express")
+bulk = lazy_imports.lazy("bulk")
+claims = lazy_imports.lazy("claims")
+financials = lazy_imports.lazy("financials")
+gantt = lazy_imports.lazy("gantt")
+progress = lazy_imports.lazy("progress")
+reports = lazy_imports.lazy("reports")
+thumbnails = lazy_imports.lazy("thumbnails")
 
 # Page Configuration
 st.set_page_config(page_title="Civitas Dashboard", layout="wide", page_icon="🏗")
@@ -15,41 +32,123 @@ if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
 if 'user_role' not in st.session_state:
     st.session_state.user_role = None
-if 'projects' not in st.session_state:
-    st.session_state.projects = []
 if 'username' not in st.session_state:
     st.session_state.username = None
 
 
-# Custom serializer for datetime objects
+# Open the project database, migrating projects.json on first run
+database.init_db()
 
 
-def custom_serializer(obj):
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+# Run a single database write, reporting failures on the page. Returns what the write returned,
+# or None if it failed.
 
 
-# Save projects to JSON
-
-
-def save_projects():
+@instrumentation.timed("save_change")
+def save_change(write, *args):
     try:
-        with open("projects.json", "w") as file:
-            json.dump(st.session_state.projects, file, indent=4, default=custom_serializer)
+        return write(*args)
+    except database.ConflictError as e:
+        st.warning(f"{e} Your change was not saved; check the latest data and try again.")
     except Exception as e:
         st.error(f"Error saving projects: {e}")
+    return None
+
+
+# Remember the row versions shown on this run and return those from the previous run, which are
+# the versions the user saw when making a change
+
+
+def seen_versions(key, ids, versions):
+    previous = st.session_state.get(key, {})
+    st.session_state[key] = {int(row_id): int(version) for row_id, version in zip(ids, versions)}
+    return previous
+
+
+# Audit events as a table; with_records adds which record each event is about. "Unknown" marks changes
+# made before the log recorded users.
+
+
+def events_table(events, with_records=False):
+    table = pd.DataFrame(events, columns=["changed_at", "changed_by", "project_id", "entity", "entity_id", "action",
+                                          "old_value", "new_value", "detail"])
+    table["changed_by"] = table["changed_by"].fillna("Unknown")
+    if not with_records:
+        table = table.drop(columns=["project_id", "entity", "entity_id"])
+    return table.rename(columns={
+        "changed_at": "When",
+        "changed_by": "By",
+        "project_id": "Project",
+        "entity": "Record",
+        "entity_id": "Record ID",
+        "action": "Action",
+        "old_value": "From",
+        "new_value": "To",
+        "detail": "Detail"
+    })
+
+
+# Copy an upload into the blob store and record only its metadata. Returns False if the project
+# already has this content. The content is stored again if a delete removed it in between.
+
+
+def store_document(project_id, uploaded_file, category):
+    for attempt in range(2):
+        uploaded_file.seek(0)
+        digest, size = blob_store.put(uploaded_file)
+        document = {
+            "name": uploaded_file.name,
+            "type": uploaded_file.type,
+            "size": size,
+            "sha256": digest,
+            "category": category
+        }
+        try:
+            document_id = database.add_document(project_id, document)
+            break
+        except FileNotFoundError:
+            if attempt:
+                raise
+    if thumbnails.source_kind(document):
+        thumbnails.request(document)
+    return document_id is not None
+
+
+# Claims table shared by every session, rebuilt only when the project's claims change
+
+
+@instrumentation.timed("dataframe: claims table")
+@st.cache_resource(max_entries=32)
+def load_claims_table(project_id, claims_version):
+    return claims.build_claims_table(project_id)
 
 
-# Load projects from JSON
+# Task timeline and Gantt figures, rebuilt only when the project's tasks change
 
 
+@instrumentation.timed("dataframe: task timeline")
+@st.cache_resource(max_entries=16)
+def load_task_timeline(project_id, tasks_version):
+    return gantt.load_timeline(project_id)
+
+
+@instrumentation.timed("chart: gantt")
+@st.cache_resource(max_entries=16)
+def load_gantt(project_id, tasks_version, window, swimlanes):
+    return gantt.build_gantt(load_task_timeline(project_id, tasks_version), window, swimlanes)
+
+
+# Project index shared by every session, kept in sync on register and delete
+
+
+@st.cache_resource
+def get_project_index():
+    return ProjectIndex()
+
+
+@instrumentation.timed("load_projects")
 def load_projects():
-    try:
-        with open("projects.json", "r") as file:
-            st.session_state.projects = json.load(file)
-    except FileNotFoundError:
-        st.session_state.projects = []
+    return get_project_index().refresh()
 
 
 # Login/Register System
@@ -89,433 +188,808 @@ def login_register():
                     st.error("Passwords do not match or fields are empty.")
 
 
-# Display Login/Register if not logged in
-
-
-if not st.session_state.logged_in:
-    login_register()
-else:
-    st.sidebar.header(f"👋 Welcome, {st.session_state.username}!")
-    if st.sidebar.button("Logout"):
-        st.session_state.logged_in = False
-        st.experimental_rerun()
-
-    # Tabs for Dashboard
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(["📂 Project Overview", "📊 Progress Tracking", "💰 Financials",
-                                                  "✅ Task Management", "📄 Documents", "💼 Interim Claims"])
-
-    # Tab 1: Project Overview
-    with tab1:
-        st.header("📂 Project Overview")
-        st.markdown("View and manage all your projects here.")
-        project_action = st.radio("Choose an action", ["Register New Project", "View Existing Projects"])
+# Project Overview page
+
+
+def show_project_overview():
+    st.header("📂 Project Overview")
+    st.markdown("View and manage all your projects here.")
+    project_action = st.radio("Choose an action", ["Register New Project", "View Existing Projects"])
+
+    if project_action == "Register New Project":
+        with st.form(key="project_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                project_name = st.text_input("Project Name")
+                project_id = st.text_input("Project ID")
+                client_name = st.text_input("Client Name")
+            with col2:
+                start_date = st.date_input("Start Date")
+                end_date = st.date_input("End Date", min_value=start_date)
+                budget = st.number_input("Budget ($)", min_value=0, value=100000)
+
+            submit = st.form_submit_button("Register Project")
+            if submit:
+                if not project_name or not project_id or not client_name:
+                    st.error("All fields are required!")
+                elif project_name in load_projects().by_name:
+                    st.error(f"A project named {project_name} already exists.")
+                else:
+                    new_project = {
+                        "name": project_name,
+                        "id": project_id,
+                        "client": client_name,
+                        "start_date": start_date.isoformat(),
+                        "end_date": end_date.isoformat(),
+                        "budget": budget,
+                        "progress": 0
+                    }
 
-        if project_action == "Register New Project":
-            with st.form(key="project_form"):
-                col1, col2 = st.columns(2)
-                with col1:
-                    project_name = st.text_input("Project Name")
-                    project_id = st.text_input("Project ID")
-                    client_name = st.text_input("Client Name")
-                with col2:
-                    start_date = st.date_input("Start Date")
-                    end_date = st.date_input("End Date", min_value=start_date)
-                    budget = st.number_input("Budget ($)", min_value=0, value=100000)
-
-                submit = st.form_submit_button("Register Project")
-                if submit:
-                    if not project_name or not project_id or not client_name:
-                        st.error("All fields are required!")
-                    else:
-                        new_project = {
-                            "name": project_name,
-                            "id": project_id,
-                            "client": client_name,
-                            "start_date": start_date.isoformat(),
-                            "end_date": end_date.isoformat(),
-                            "budget": budget,
-                            "progress": 0,
-                            "tasks": [],
-                            "documents": [],
-                            "interim_claims": []  # Ensure interim_claims is initialized as an empty list
-                        }
-
-                        st.session_state.projects.append(new_project)
-                        save_projects()
-                        st.success(f"Project {project_name} registered successfully!")
-
-        elif project_action == "View Existing Projects":
-            load_projects()
-
-            if st.session_state.projects:
-                project_names = [proj["name"] for proj in st.session_state.projects]
-                selected_project = st.selectbox("Select a Project to Track", project_names,
-                                                key="existing_project_select")
-                project_data = next(proj for proj in st.session_state.projects if proj["name"] == selected_project)
-                st.write("**Project Details:**")
-                st.json(project_data)
-
-                # Option to delete project
-                if st.button("Delete Project", key=f"delete_{selected_project}"):
-                    st.session_state.projects = [proj for proj in st.session_state.projects if
-                                                 proj["name"] != selected_project]
-                    save_projects()
-                    st.success(f"Project {selected_project} deleted successfully!")
-            else:
-                st.info("No projects available. Please register a new project.")
+                    save_change(get_project_index().register, new_project)
+                    st.success(f"Project {project_name} registered successfully!")
 
-    # Tab 2: Progress Tracking
-    with tab2:
-        import streamlit as st
-        import pandas as pd
-        from datetime import datetime
+    elif project_action == "View Existing Projects":
+        projects = load_projects()
 
-        # Sample data for building elements
-        building_elements = ["Foundation", "Superstructure", "Roofing", "Finishes", "Electrical Work"]
+        if projects.names:
+            selected_project = st.selectbox("Select a Project to Track", projects.names,
+                                            key="existing_project_select")
+            project_data = projects.by_name[selected_project]
+            st.write("**Project Details:**")
+            st.json(project_data)
 
-        # Initialize or load progress data (using a dictionary here, but you could load from a database/file)
-        if "progress_data" not in st.session_state:
-            st.session_state.progress_data = {
-                element: {"progress": 0, "last_updated": None} for element in building_elements
-            }
+            # Option to delete project
+            if st.button("Delete Project", key=f"delete_{selected_project}"):
+                save_change(get_project_index().delete, project_data["id"], st.session_state.username)
+                st.success(f"Project {selected_project} deleted successfully!")
+        else:
+            st.info("No projects available. Please register a new project.")
 
 
-# Function to update progress and timestamp
+# Progress Tracking page
 
 
-        def update_progress(element, progress_value):
-            # Get current date and time
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # Update progress and timestamp for the specific building element
-            st.session_state.progress_data[element]["progress"] = progress_value
-            st.session_state.progress_data[element]["last_updated"] = current_time
+def show_progress_tracking():
+    st.header("Project Progress Tracking")
 
+    projects = load_projects()
+    if not projects.names:
+        st.info("No projects available. Please register a new project.")
+        return
+    selected_project = st.selectbox("Select a Project for Progress", projects.names, key="progress_select")
+    project_data = projects.by_name[selected_project]
 
-        # Show progress tracking for each element
-        st.header("Project Progress Tracking")
+    # Latest reading for each building element
+    latest = database.latest_progress(project_data["id"])
 
-        # Create a list to store the progress data for the bar chart
-        progress_values = []
-        labels = []
+    # Create a list to store the progress data for the bar chart
+    progress_values = []
+    labels = []
 
-        # Iterate through each building element
-        for element in building_elements:
-            st.subheader(f"{element}")
+    # Iterate through each building element
+    for element in progress.BUILDING_ELEMENTS:
+        st.subheader(f"{element}")
 
-            # Get the current progress and last updated timestamp
-            progress = st.session_state.progress_data[element]["progress"]
-            last_updated = st.session_state.progress_data[element]["last_updated"]
+        # Get the current progress and last updated timestamp
+        progress_value = latest.get(element, {}).get("progress", 0)
+        last_updated = latest.get(element, {}).get("last_updated")
 
-            # Display the current progress and last updated time
-            st.write(f"Progress: {progress}%")
-            if last_updated:
-                st.write(f"Last Updated: {last_updated}")
-            else:
-                st.write("Last Updated: Never")
+        # Display the current progress and last updated time
+        st.write(f"Progress: {progress_value}%")
+        if last_updated:
+            st.write(f"Last Updated: {last_updated}")
+        else:
+            st.write("Last Updated: Never")
 
-            # Slider to update the progress
-            progress_slider = st.slider(f"Update Progress for {element}", 0, 100, progress)
+        # Slider to update the progress
+        progress_slider = st.slider(f"Update Progress for {element}", 0, 100, progress_value)
 
-            # Update progress when slider is moved
-            if progress_slider != progress:
-                update_progress(element, progress_slider)
+        # Record a new reading when the slider is moved
+        if progress_slider != progress_value:
+            save_change(database.record_progress, project_data["id"], element, progress_slider,
+                        st.session_state.username)
 
-            # Store progress values for the bar chart
-            progress_values.append(progress)
-            labels.append(element)
+        # Store progress values for the bar chart
+        progress_values.append(progress_value)
+        labels.append(element)
 
-        # Display bar chart for progress
-        st.subheader("Progress of Building Elements")
+    # Display bar chart for progress
+    st.subheader("Progress of Building Elements")
+    with instrumentation.timer("chart: element progress"):
         df = pd.DataFrame({"Element": labels, "Progress": progress_values})
         st.bar_chart(df.set_index("Element"))
 
-        # Calculate overall progress (weighted average of individual elements' progress)
-        total_progress = sum(progress_values) / len(building_elements)
-        st.subheader("Overall Project Progress")
-        st.write(f"Overall Progress: {total_progress:.2f}%")
-
-    # Tab 3: Financials
-    with tab3:
-        st.header("💰 Financial Overview")
-        st.write("Track budgets and spending dynamically.")
-        if st.session_state.projects:
-            project_names = [proj["name"] for proj in st.session_state.projects]
-            selected_project = st.selectbox("Select a Project for Financials", project_names, key="financials_select")
-            project_data = next(proj for proj in st.session_state.projects if proj["name"] == selected_project)
-
-            spent = st.number_input("Spent Amount ($)", min_value=0, value=0, key=f"spent_input_{selected_project}")
-            remaining = project_data["budget"] - spent
-            st.write(f"Remaining Budget: ${remaining}")
-
-            # Display financial breakdown
-            financial_data = {
-                "Spent": spent,
-                "Remaining": remaining,
-                "Total Budget": project_data["budget"]
-            }
+    # Calculate overall progress (weighted average of individual elements' progress)
+    total_progress = sum(progress_values) / len(progress.BUILDING_ELEMENTS)
+    st.subheader("Overall Project Progress")
+    st.write(f"Overall Progress: {total_progress:.2f}%")
+
+    # Progress history from the daily or weekly rollups
+    st.subheader("Progress Trend")
+    granularity = st.radio("Show Progress History by", list(progress.ROLLUPS), horizontal=True)
+    with instrumentation.timer("dataframe: progress trend"):
+        trend = progress.load_trend(project_data["id"], granularity)
+    if trend.empty:
+        st.info("No progress has been recorded for this project yet.")
+    else:
+        with instrumentation.timer("chart: progress trend"):
+            st.line_chart(trend)
+            st.subheader("S-Curve")
+            st.area_chart(progress.s_curve(trend))
+
+
+# Financials page
+
+
+def show_financials():
+    st.header("💰 Financial Overview")
+    st.write("Track budgets against interim claims for a project, a client or the whole portfolio.")
+    projects = load_projects()
+    if projects.names:
+        scope = st.radio("Show Financials for", ["Project", "Client", "Portfolio"], horizontal=True)
+        scope_key = ""
+        if scope == "Project":
+            selected_project = st.selectbox("Select a Project for Financials", projects.names, key="financials_select")
+            scope_key = projects.by_name[selected_project]["id"]
+        elif scope == "Client":
+            clients = sorted({proj["client"] or "" for proj in projects.by_id.values()})
+            scope_key = st.selectbox("Select a Client", clients)
+        with instrumentation.timer("dataframe: financial summary"):
+            summary = financials.load_summary(scope.lower(), scope_key)
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Total Budget", f"${summary['budget']:,.2f}")
+        col2.metric("Approved Claims", f"${summary['approved']:,.2f}")
+        col3.metric("Pending Claims", f"${summary['pending']:,.2f}")
+        col4.metric("Rejected Claims", f"${summary['rejected']:,.2f}")
+        st.write(f"Remaining Budget: ${summary['remaining']:,.2f}")
+        st.write(f"Burn Rate: ${summary['burn_rate']:,.2f} per month "
+                 f"(approved claims, last {financials.BURN_RATE_MONTHS} months)")
+        if summary["months_remaining"] is not None:
+            st.write(f"Budget lasts about {summary['months_remaining']:.1f} more months at this rate.")
+
+        # Display financial breakdown
+        financial_data = {
+            "Approved Claims": summary["approved"],
+            "Pending Claims": summary["pending"],
+            "Unclaimed": max(summary["budget"] - summary["approved"] - summary["pending"], 0)
+        }
+        with instrumentation.timer("chart: budget breakdown"):
             financial_fig = px.pie(names=list(financial_data.keys()), values=list(financial_data.values()),
                                    title="Budget Breakdown")
             st.plotly_chart(financial_fig)
 
-    # Tab 4: Task Management
-    with tab4:
-        st.header("📅 Task Management & Scheduling")
-        st.write("Manage and schedule tasks efficiently for each project.")
-
-        if st.session_state.projects:
-            project_names = [proj["name"] for proj in st.session_state.projects]
-            selected_project = st.selectbox("Select a Project", project_names, key="task_management_select")
-            project_data = next(proj for proj in st.session_state.projects if proj["name"] == selected_project)
-
-            # Display existing tasks
-            st.subheader("Current Tasks")
-            if project_data["tasks"]:
-                for task in project_data["tasks"]:
-                    st.write(f"**Task:** {task['task_name']}")
-                    st.write(f"**Assigned To:** {task['assigned_to']}")
-                    st.write(f"**Priority:** {task['priority']}")
-                    st.write(f"**Deadline:** {task['deadline']}")
-                    st.write(f"**Status:** {task['status']}")
-                    st.write(f"**Description:** {task['description']}")
-
-                    # Task status update
-                    status_update = st.selectbox(f"Update Status for {task['task_name']}",
-                                                 ["Pending", "In Progress", "Completed"],
-                                                 key=f"status_update_{task['task_name']}")
-                    if st.button(f"Update Status for {task['task_name']}", key=f"update_button_{task['task_name']}"):
-                        task["status"] = status_update
-                        save_projects()
-                        st.success(f"Status of {task['task_name']} updated to {status_update}.")
-
-                    # Task comments
-                    st.subheader(f"Comments on {task['task_name']}")
-                    task_comments = st.text_area(f"Add a comment for {task['task_name']}",
-                                                 key=f"comment_{task['task_name']}")
-                    if st.button(f"Save Comment for {task['task_name']}", key=f"comment_button_{task['task_name']}"):
-                        if 'comments' not in task:
-                            task['comments'] = []
-                        task['comments'].append(task_comments)
-                        save_projects()
-                        st.success(f"Comment added for {task['task_name']}.")
-
+        # Claims by payment month
+        if not summary["monthly"].empty:
+            st.subheader("Claims by Payment Month")
+            st.bar_chart(summary["monthly"])
+
+
+# Task Management page
+
+
+def show_task_management():
+    st.header("📅 Task Management & Scheduling")
+    st.write("Manage and schedule tasks efficiently for each project.")
+
+    projects = load_projects()
+    if projects.names:
+        selected_project = st.selectbox("Select a Project", projects.names, key="task_management_select")
+        project_data = projects.by_name[selected_project]
+
+        # Display existing tasks one page at a time
+        st.subheader("Current Tasks")
+        task_count = database.count_tasks(project_data["id"])
+        if task_count:
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                sort_by = st.selectbox("Sort Tasks By", list(database.TASK_SORT_KEYS))
+            with col2:
+                descending = st.checkbox("Descending")
+            with col3:
+                page_size = st.selectbox("Tasks per Page", [25, 50, 100])
+            with col4:
+                page_count = (task_count + page_size - 1) // page_size
+                page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+
+            # Status is edited in the grid; a new editor key after saving drops the applied edits.
+            # Edits are applied to the page exactly as the user saw it, so a change someone else
+            # made in the meantime neither discards the edits nor gets overwritten by them.
+            if "task_grid_generation" not in st.session_state:
+                st.session_state.task_grid_generation = 0
+            grid_key = f"task_grid_{project_data['id']}_{st.session_state.task_grid_generation}"
+            shown_key, shown_df = st.session_state.get("task_grid_shown", (None, None))
+            if shown_key == grid_key and st.session_state.get(grid_key, {}).get("edited_rows"):
+                task_df = shown_df
             else:
-                st.info("No tasks available. Please add new tasks.")
-
-            # Adding a new task
-            st.subheader("Add a New Task")
-            task_name = st.text_input("Task Name")
-            assigned_to = st.text_input("Assign to")
-            priority = st.selectbox("Priority", ["High", "Medium", "Low"])
-            deadline = st.date_input("Deadline")
-            description = st.text_area("Task Description")
-
-            if st.button("Add Task"):
-                if task_name and assigned_to and description:
-                    new_task = {
-                        "task_name": task_name,
-                        "assigned_to": assigned_to,
-                        "priority": priority,
-                        "deadline": deadline,
-                        "status": "Pending",  # Default status
-                        "description": description,
-                        "comments": []  # Comments section for the task
-                    }
-                    project_data["tasks"].append(new_task)
-                    save_projects()
-                    st.success(f"New task '{task_name}' added successfully!")
-                else:
-                    st.error("Please fill in all the required fields.")
-
-            # Task Search & Filter
-            st.subheader("Search and Filter Tasks")
-            search_query = st.text_input("Search for a task")
-            filtered_tasks = [task for task in project_data["tasks"] if
-                              search_query.lower() in task["task_name"].lower()]
-
-            if filtered_tasks:
-                for task in filtered_tasks:
-                    st.write(f"**Task Name:** {task['task_name']}")
-                    st.write(f"Assigned to: {task['assigned_to']}")
-                    st.write(f"Priority: {task['priority']}")
-                    st.write(f"Deadline: {task['deadline']}")
-                    st.write(f"Status: {task['status']}")
+                with instrumentation.timer("dataframe: task page"):
+                    tasks = database.list_tasks(project_data["id"], sort_by, descending, page_size,
+                                                (page - 1) * page_size)
+                    task_df = pd.DataFrame(tasks).set_index("id")
+                st.session_state.task_grid_shown = (grid_key, task_df)
+            edited_df = st.data_editor(
+                task_df,
+                column_config={
+                    "task_name": "Task",
+                    "assigned_to": "Assigned To",
+                    "priority": "Priority",
+                    "deadline": "Deadline",
+                    "status": st.column_config.SelectboxColumn("Status",
+                                                               options=["Pending", "In Progress", "Completed"],
+                                                               required=True),
+                    "description": "Description",
+                    "version": None
+                },
+                disabled=["task_name", "assigned_to", "priority", "deadline", "description"],
+                key=grid_key)
+            changed = edited_df["status"] != task_df["status"]
+            if changed.any():
+                # Edits to different tasks never conflict; an edit to a task someone else changed is refused
+                saved_all = True
+                for task_id, status_update in edited_df.loc[changed, "status"].items():
+                    if save_change(database.update_task_status, int(task_id), status_update,
+                                   int(task_df.at[task_id, "version"]), st.session_state.username) is None:
+                        saved_all = False
+                st.session_state.task_grid_generation += 1
+                if saved_all:
+                    st.rerun()
+
+            # Details and comments only for the selected task
+            task_names = dict(zip(task_df.index, task_df["task_name"]))
+            selected_task_id = st.selectbox("Task Details", list(task_names), format_func=task_names.get)
+            task = task_df.loc[selected_task_id]
+            st.write(f"**Description:** {task['description']}")
+
+            # Task comments
+            st.subheader(f"Comments on {task['task_name']}")
+            for comment in database.list_comments(int(selected_task_id)):
+                st.text(comment)
+            task_comments = st.text_area(f"Add a comment for {task['task_name']}",
+                                         key=f"comment_{selected_task_id}")
+            if st.button(f"Save Comment for {task['task_name']}", key=f"comment_button_{selected_task_id}"):
+                save_change(database.add_comment, int(selected_task_id), task_comments, st.session_state.username)
+                st.success(f"Comment added for {task['task_name']}.")
+
+            # Every change to the task: who made it and when
+            with st.expander(f"History of {task['task_name']}"):
+                st.dataframe(events_table(database.list_events(entity="task", entity_id=int(selected_task_id))),
+                             hide_index=True)
+
+        else:
+            st.info("No tasks available. Please add new tasks.")
+
+        # Adding a new task
+        st.subheader("Add a New Task")
+        task_name = st.text_input("Task Name")
+        assigned_to = st.text_input("Assign to")
+        priority = st.selectbox("Priority", ["High", "Medium", "Low"])
+        task_start = st.date_input("Start Date", key="task_start_date")
+        deadline = st.date_input("Deadline")
+        description = st.text_area("Task Description")
+
+        if st.button("Add Task"):
+            if deadline < task_start:
+                st.error("The deadline cannot be before the start date.")
+            elif task_name and assigned_to and description:
+                new_task = {
+                    "task_name": task_name,
+                    "assigned_to": assigned_to,
+                    "priority": priority,
+                    "start_date": task_start,
+                    "deadline": deadline,
+                    "status": "Pending",  # Default status
+                    "description": description
+                }
+                save_change(database.add_task, project_data["id"], new_task, st.session_state.username)
+                st.success(f"New task '{task_name}' added successfully!")
             else:
-                st.info("No tasks found matching the search query.")
-
-            # Gantt Chart Representation (Optional)
-            st.subheader("Task Timeline (Gantt Chart)")
-            # You can implement this using a package like Plotly or Altair for interactive Gantt charts
-            # Example placeholder for Gantt chart integration
-            # Gantt chart would be shown here for visualizing task timelines.
-
-            # Task Scheduling - Gantt chart integration can also be added here
-            st.write("Gantt Chart could be integrated here to visualize tasks' timelines.")
-
-    # Tab 5: Documents
-    with tab5:
-        st.header("📄 Document Management")
-        st.write("Upload and manage project documents.")
-
-        if st.session_state.projects:
-            project_names = [proj["name"] for proj in st.session_state.projects]
-            selected_project = st.selectbox("Select a Project for Documents", project_names,
-                                            key="document_management_select")
-            project_data = next(proj for proj in st.session_state.projects if proj["name"] == selected_project)
-
-            # Show uploaded documents
-            st.subheader("Uploaded Documents")
-            if project_data["documents"]:
-                for idx, doc in enumerate(project_data["documents"]):
-                    st.write(f"**Document {idx + 1}:**")
-                    st.text(f"Filename: {doc.name}")
-                    st.text(f"Type: {doc.type}")
-                    st.download_button(label="Download", data=doc, file_name=doc.name)
-                    if st.button(f"Delete Document {idx + 1}", key=f"delete_doc_{idx}"):
-                        project_data["documents"].remove(doc)
-                        save_projects()
-                        st.success(f"Document {doc.name} deleted successfully!")
+                st.error("Please fill in all the required fields.")
+
+        # Task Search & Filter
+        st.subheader("Search and Filter Tasks")
+        search_query = st.text_input("Search for a task", help="Matches names, descriptions, assignees and "
+                                                               "comments; words match as prefixes.")
+        search_all = st.checkbox("Search all projects")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            status_filter = st.multiselect("Filter by Status", ["Pending", "In Progress", "Completed"])
+        with col2:
+            priority_filter = st.multiselect("Filter by Priority", ["High", "Medium", "Low"])
+        with col3:
+            deadline_filter = st.date_input("Deadline Between", value=())
+        with instrumentation.timer("task search"):
+            filtered_tasks = task_search.search_tasks(search_query, None if search_all else project_data["id"],
+                                                      status_filter, priority_filter,
+                                                      deadline_filter if len(deadline_filter) == 2 else None,
+                                                      limit=20)
+
+        if filtered_tasks:
+            results_df = pd.DataFrame(filtered_tasks)[["task_name", "project_name", "assigned_to", "priority",
+                                                       "deadline", "status"]]
+            if not search_all:
+                results_df = results_df.drop(columns="project_name")
+            st.dataframe(results_df, hide_index=True, column_config={
+                "task_name": "Task Name",
+                "project_name": "Project",
+                "assigned_to": "Assigned To",
+                "priority": "Priority",
+                "deadline": "Deadline",
+                "status": "Status"
+            })
+        else:
+            st.info("No tasks found matching the search query.")
+
+        # Gantt Chart Representation
+        st.subheader("Task Timeline (Gantt Chart)")
+        tasks_version = database.get_tasks_version(project_data["id"])
+        timeline = load_task_timeline(project_data["id"], tasks_version)
+        if timeline.empty:
+            st.info("No scheduled tasks to show yet.")
+        else:
+            first_day = timeline["start"].min().date()
+            last_day = (timeline["finish"].max() - pd.Timedelta(days=1)).date()
+            swimlanes = st.radio("Group Tasks into Swimlanes by", list(gantt.SWIMLANE_COLUMNS), horizontal=True)
+            window = (first_day, last_day)
+            if first_day < last_day:
+                window = st.slider("Timeline Window", min_value=first_day, max_value=last_day, value=window)
+            gantt_fig, visible_count = load_gantt(project_data["id"], tasks_version, window, swimlanes)
+            if visible_count > gantt.DETAIL_LIMIT:
+                st.caption(f"{visible_count} tasks in this window are grouped into swimlanes. "
+                           f"Narrow the window to {gantt.DETAIL_LIMIT} tasks or fewer to see each task.")
+            with instrumentation.timer("chart: gantt render"):
+                st.plotly_chart(gantt_fig, use_container_width=True)
+
+
+# Documents page
+
+
+def show_documents():
+    st.header("📄 Document Management")
+    st.write("Upload and manage project documents.")
+
+    projects = load_projects()
+    if projects.names:
+        selected_project = st.selectbox("Select a Project for Documents", projects.names,
+                                        key="document_management_select")
+        project_data = projects.by_name[selected_project]
+
+        # Show uploaded documents
+        st.subheader("Uploaded Documents")
+        documents = database.list_documents(project_data["id"])
+        view = "List"
+        if any(thumbnails.source_kind(doc) for doc in documents):
+            view = st.radio("Show Documents as", ["Gallery", "List"], horizontal=True, key="document_view")
+        if view == "Gallery":
+            show_document_gallery(project_data["id"], documents)
+        elif documents:
+            for idx, doc in enumerate(documents):
+                st.write(f"**Document {idx + 1}:**")
+                st.text(f"Filename: {doc['name']}")
+                st.text(f"Type: {doc['type']}")
+                st.text(f"Size: {doc['size'] / 1024:.1f} KB")
+                st.text(f"Category: {doc['category'] or 'Uncategorized'}")
+                # Only read the file when a download is requested, not on every rerun
+                if st.button("Download", key=f"prepare_doc_{doc['id']}"):
+                    st.download_button(label=f"Save {doc['name']}", data=blob_store.read(doc["sha256"]),
+                                       file_name=doc["name"], mime=doc["type"], key=f"download_doc_{doc['id']}")
+                if st.button(f"Delete Document {idx + 1}", key=f"delete_doc_{doc['id']}"):
+                    save_change(database.remove_document, doc["id"])
+                    st.success(f"Document {doc['name']} deleted successfully!")
+        else:
+            st.info("No documents uploaded yet. Please upload a new document.")
+
+        # Document categorization (example: project-specific tags)
+        categories = ["Contracts", "Plans", "Invoices", "Reports"]
+        doc_category = st.selectbox("Select Document Category", categories)
+        st.text(f"Selected category: {doc_category}")
+
+        # Upload multiple documents
+        uploaded_files = st.file_uploader("Upload Documents", type=["pdf", "docx", "png", "jpg", "jpeg"],
+                                          accept_multiple_files=True)
+        if "stored_uploads" not in st.session_state:
+            st.session_state.stored_uploads = set()
+        new_files = [uploaded_file for uploaded_file in uploaded_files or []
+                     if uploaded_file.file_id not in st.session_state.stored_uploads]
+        if new_files:
+            duplicates = []
+            uploaded_count = 0
+            for uploaded_file in new_files:
+                stored = save_change(store_document, project_data["id"], uploaded_file, doc_category)
+                st.session_state.stored_uploads.add(uploaded_file.file_id)
+                if stored:
+                    uploaded_count += 1
+                elif stored is False:
+                    duplicates.append(uploaded_file.name)
+            if uploaded_count:
+                st.success(f"{uploaded_count} document(s) uploaded successfully!")
+            if duplicates:
+                st.info(f"Already in this project, not added again: {', '.join(duplicates)}")
+
+        # Option to add metadata for documents
+        st.subheader("Add Document Metadata")
+        doc_title = st.text_input("Document Title")
+        doc_description = st.text_area("Document Description")
+        if st.button("Save Metadata"):
+            if doc_title and doc_description:
+                metadata = {"Title": doc_title, "Description": doc_description}
+                st.session_state.document_metadata = metadata
+                st.success("Metadata saved!")
             else:
-                st.info("No documents uploaded yet. Please upload a new document.")
-
-            # Upload multiple documents
-            uploaded_files = st.file_uploader("Upload Documents", type=["pdf", "docx", "png", "jpg", "jpeg"],
-                                              accept_multiple_files=True)
-            if uploaded_files:
-                for uploaded_file in uploaded_files:  # Renaming 'file' to 'uploaded_file'
-                    project_data["documents"].append(uploaded_file)
-                save_projects()
-                st.success("Documents uploaded successfully!")
-
-            # Document categorization (example: project-specific tags)
-            categories = ["Contracts", "Plans", "Invoices", "Reports"]
-            doc_category = st.selectbox("Select Document Category", categories)
-            st.text(f"Selected category: {doc_category}")
-
-            # Option to add metadata for documents
-            st.subheader("Add Document Metadata")
-            doc_title = st.text_input("Document Title")
-            doc_description = st.text_area("Document Description")
-            if st.button("Save Metadata"):
-                if doc_title and doc_description:
-                    metadata = {"Title": doc_title, "Description": doc_description}
-                    st.session_state.document_metadata = metadata
-                    st.success("Metadata saved!")
-                else:
-                    st.error("Please fill in both the title and description fields.")
-
-    # Tab 6: Interim Claims
-    with tab6:
-        st.header("💼 Interim Claims")
-        st.write("Manage interim claims and track payments.")
-
-        if st.session_state.projects:
-            project_names = [proj["name"] for proj in st.session_state.projects]
-            selected_project = st.selectbox("Select a Project for Interim Claims", project_names,
-                                            key="interim_claims_select")
-            project_data = next(proj for proj in st.session_state.projects if proj["name"] == selected_project)
-
-            # Ensure interim_claims is initialized
-            if "interim_claims" not in project_data:
-                project_data["interim_claims"] = []
-
-            interim_claim_action = st.radio("Interim Claims Action",
-                                            ["View Claims", "Add New Claim", "Update Claim Status"])
-
-            if interim_claim_action == "Add New Claim":
-                # Add New Claim Form
-                claim_amount = st.number_input("Claim Amount ($)", min_value=0)
-                claim_status = st.selectbox("Claim Status", ["Pending", "Approved", "Rejected"])
-                payment_schedule = st.date_input("Payment Schedule")
-                notes = st.text_area("Claim Notes", placeholder="Add any notes or comments")
-
-                if st.button("Add Claim"):
-                    project_data["interim_claims"].append({
-                        "amount": claim_amount,
-                        "status": claim_status,
-                        "payment_schedule": payment_schedule.isoformat(),
-                        "notes": notes
-                    })
-                    save_projects()
-                    st.success(f"Claim of ${claim_amount} added successfully!")
-
-            elif interim_claim_action == "View Claims":
-                # View Claims in Table Form with Search and Filter
-                if project_data["interim_claims"]:
-                    # Convert claims data to DataFrame
-                    claims_df = pd.DataFrame(project_data["interim_claims"])
-                    claims_df.index += 1  # Start indexing from 1
-                    claims_df = claims_df.rename(columns={
-                        "amount": "Claim Amount ($)",
-                        "status": "Claim Status",
-                        "payment_schedule": "Payment Schedule",
-                        "notes": "Claim Notes"
-                    })
-
-                    # Filter by status, amount, or date
-                    filter_status = st.selectbox("Filter by Claim Status", ["All", "Pending", "Approved", "Rejected"],
-                                                 index=0)
-                    if filter_status != "All":
-                        claims_df = claims_df[claims_df["Claim Status"] == filter_status]
-
-                    # Search bar for amount or notes
-                    search_term = st.text_input("Search Claims", "")
-                    if search_term:
-                        claims_df = claims_df[
-                            claims_df.apply(lambda row: row.astype(str).str.contains(search_term).any(), axis=1)]
-
-                    # Sorting options
-                    sort_by = st.selectbox("Sort Claims By", ["Claim Amount ($)", "Payment Schedule", "Claim Status"],
-                                           index=0)
-                    claims_df = claims_df.sort_values(by=sort_by, ascending=True)
+                st.error("Please fill in both the title and description fields.")
+
+
+# Thumbnails of a project's images and PDFs, a page at a time, and a larger preview of one of them.
+# Both come from the preview cache; missing ones are rendered in the background and appear when ready.
+
+
+def show_document_gallery(project_id, documents):
+    previewable = [doc for doc in documents if thumbnails.source_kind(doc)]
+    page_count = -(-len(previewable) // thumbnails.GALLERY_PAGE_SIZE)
+    page = 1
+    if page_count > 1:
+        page = st.number_input(f"Gallery Page (of {page_count})", min_value=1, max_value=page_count, value=1,
+                               key=f"gallery_page_{project_id}")
+    first = (page - 1) * thumbnails.GALLERY_PAGE_SIZE
+    waiting = []
+    columns = st.columns(thumbnails.GALLERY_COLUMNS)
+    for position, doc in enumerate(previewable[first:first + thumbnails.GALLERY_PAGE_SIZE]):
+        with columns[position % thumbnails.GALLERY_COLUMNS]:
+            path = thumbnails.get(doc, "thumbnail")
+            if path:
+                st.image(path, caption=doc["name"], use_container_width=True)
+            else:
+                st.caption(f"⏳ {doc['name']}")
+                waiting.append(doc["sha256"])
+
+    by_id = {doc["id"]: doc for doc in previewable}
+    preview_id = st.selectbox("Preview Document", list(by_id), format_func=lambda doc_id: by_id[doc_id]["name"],
+                              key=f"preview_document_{project_id}")
+    preview_doc = by_id[preview_id]
+    path = thumbnails.get(preview_doc, "preview")
+    if path:
+        st.image(path, caption=f"{preview_doc['name']} ({preview_doc['category'] or 'Uncategorized'})")
+    else:
+        waiting.append(preview_doc["sha256"])
+    if waiting:
+        poll_thumbnails(waiting)
+
+
+@st.fragment(run_every=2)
+def poll_thumbnails(digests):
+    if not any(thumbnails.is_pending(digest) for digest in digests):
+        st.rerun()
+    st.info("Generating previews...")
+
+
+# Interim Claims page
+
+
+def show_interim_claims():
+    st.header("💼 Interim Claims")
+    st.write("Manage interim claims and track payments.")
+
+    projects = load_projects()
+    if projects.names:
+        selected_project = st.selectbox("Select a Project for Interim Claims", projects.names,
+                                        key="interim_claims_select")
+        project_data = projects.by_name[selected_project]
+
+        claims_table = load_claims_table(project_data["id"], database.get_claims_version(project_data["id"]))
+        shown_versions = seen_versions("claim_versions_seen", claims_table["id"], claims_table["version"])
+
+        interim_claim_action = st.radio("Interim Claims Action",
+                                        ["View Claims", "Add New Claim", "Update Claim Status"])
+
+        if interim_claim_action == "Add New Claim":
+            # Add New Claim Form
+            claim_amount = st.number_input("Claim Amount ($)", min_value=0)
+            claim_status = st.selectbox("Claim Status", ["Pending", "Approved", "Rejected"])
+            payment_schedule = st.date_input("Payment Schedule")
+            notes = st.text_area("Claim Notes", placeholder="Add any notes or comments")
+
+            if st.button("Add Claim"):
+                save_change(database.add_claim, project_data["id"], {
+                    "amount": claim_amount,
+                    "status": claim_status,
+                    "payment_schedule": payment_schedule.isoformat(),
+                    "notes": notes
+                }, st.session_state.username)
+                st.success(f"Claim of ${claim_amount} added successfully!")
+
+        elif interim_claim_action == "View Claims":
+            # View Claims in Table Form with Search and Filter
+            if not claims_table.empty:
+                # Filter by status, amount, or date
+                filter_status = st.selectbox("Filter by Claim Status", ["All"] + claims.CLAIM_STATUSES,
+                                             index=0)
+                col1, col2 = st.columns(2)
+                with col1:
+                    min_amount = st.number_input("Minimum Amount ($)", min_value=0.0, value=0.0)
+                with col2:
+                    max_amount = st.number_input("Maximum Amount ($)", min_value=0.0,
+                                                 value=float(claims_table["amount"].max()))
+                date_range = None
+                payment_dates = claims_table["payment_schedule"].dropna()
+                if not payment_dates.empty:
+                    picked_dates = st.date_input("Payment Schedule Between",
+                                                 value=(payment_dates.min().date(), payment_dates.max().date()))
+                    if len(picked_dates) == 2:
+                        date_range = picked_dates
+
+                # Search bar for amount, status, date or notes
+                search_term = st.text_input("Search Claims", "")
+
+                with instrumentation.timer("dataframe: claims filter"):
+                    claims_df = claims.filter_claims(claims_table, filter_status, (min_amount, max_amount),
+                                                     date_range, search_term)
+
+                # Sorting options
+                sort_by = st.selectbox("Sort Claims By", ["Claim Amount ($)", "Payment Schedule", "Claim Status"],
+                                       index=0)
+                sort_column = {label: column for column, label in claims.DISPLAY_COLUMNS.items()}[sort_by]
+                with instrumentation.timer("dataframe: claims table display"):
+                    claims_df = claims.display_claims(claims_df.sort_values(by=sort_column, ascending=True))
 
                     # Display the claims table
                     st.dataframe(claims_df)
 
-                    # Export Claims to CSV
-                    if st.button("Export Claims to CSV"):
-                        csv = claims_df.to_csv(index=False)
-                        st.download_button("Download CSV", csv, "claims_data.csv", "text/csv")
+                # Export Claims to CSV
+                if st.button("Export Claims to CSV"):
+                    csv = claims_df.to_csv(index=False)
+                    st.download_button("Download CSV", csv, "claims_data.csv", "text/csv")
 
-                else:
-                    st.info("No interim claims found for this project.")
-
-            elif interim_claim_action == "Update Claim Status":
-                # Update Existing Claim Status
-                if project_data["interim_claims"]:
-                    claim_options = [f"Claim #{idx + 1}" for idx in range(len(project_data["interim_claims"]))]
-                    selected_claim = st.selectbox("Select a Claim to Update", claim_options)
-
-                    # Get the selected claim's index
-                    claim_idx = claim_options.index(selected_claim)
-                    selected_claim_data = project_data["interim_claims"][claim_idx]
-
-                    # Allow user to update the status of the selected claim
-                    new_status = st.selectbox("Update Claim Status", ["Pending", "Approved", "Rejected"],
-                                              index=["Pending", "Approved", "Rejected"].index(
-                                                  selected_claim_data["status"]))
-
-                    if st.button(f"Update Status for {selected_claim}"):
-                        # Update the claim's status
-                        project_data["interim_claims"][claim_idx]["status"] = new_status
-                        save_projects()
+            else:
+                st.info("No interim claims found for this project.")
+
+        elif interim_claim_action == "Update Claim Status":
+            # Update Existing Claim Status
+            if not claims_table.empty:
+                claim_options = [f"Claim #{idx}" for idx in claims_table.index]
+                selected_claim = st.selectbox("Select a Claim to Update", claim_options)
+
+                # Get the selected claim's row
+                selected_claim_data = claims_table.loc[claim_options.index(selected_claim) + 1]
+
+                # Allow user to update the status of the selected claim
+                new_status = st.selectbox("Update Claim Status", ["Pending", "Approved", "Rejected"],
+                                          index=["Pending", "Approved", "Rejected"].index(
+                                              selected_claim_data["status"]))
+
+                if st.button(f"Update Status for {selected_claim}"):
+                    # Update the claim's status unless someone else changed it since it was shown
+                    claim_id = int(selected_claim_data["id"])
+                    version = save_change(database.update_claim_status, claim_id, new_status,
+                                          shown_versions.get(claim_id), st.session_state.username)
+                    if version is not None:
+                        st.session_state.claim_versions_seen[claim_id] = version
                         st.success(f"The status for {selected_claim} has been updated to {new_status}.")
+            else:
+                st.info("No interim claims found for this project.")
+
+        # Claim History or Audit Trail, from the append-only event log
+        if not claims_table.empty:
+            st.subheader("Claim History / Audit Trail")
+            claim_numbers = dict(zip(claims_table["id"].astype(int), claims_table.index))
+            history_for = st.selectbox("Show History for", [None] + list(claim_numbers),
+                                       format_func=lambda claim_id: "All Claims" if claim_id is None
+                                       else f"Claim #{claim_numbers[claim_id]}")
+            if history_for is None:
+                events = database.list_events(project_id=project_data["id"], entity="claim")
+            else:
+                events = database.list_events(entity="claim", entity_id=history_for)
+            audit_df = events_table(events, with_records=True).drop(columns=["Project", "Record"])
+            audit_df["Record ID"] = audit_df["Record ID"].map(
+                lambda claim_id: f"Claim #{claim_numbers[claim_id]}" if claim_id in claim_numbers else "Deleted")
+            st.dataframe(audit_df.rename(columns={"Record ID": "Claim"}), hide_index=True)
+
+
+# Reports page
+
+
+def show_reports():
+    st.header("📑 Monthly Reports")
+    st.write("Progress claim and valuation reports per project, rendered in the background.")
+    projects = load_projects()
+    if projects.names:
+        selected_project = st.selectbox("Select a Project for Reports", projects.names, key="reports_select")
+        project_data = projects.by_name[selected_project]
+        months = pd.period_range(project_data["start_date"], max(pd.Timestamp(project_data["start_date"]),
+                                                                  pd.Timestamp.today()), freq="M")
+        month = st.selectbox("Reporting Month", [str(period) for period in reversed(months)])
+
+        # Requested reports by project and month; the page polls until they are rendered
+        if "report_requests" not in st.session_state:
+            st.session_state.report_requests = {}
+        request_key = (project_data["id"], month)
+        if st.button("Generate Report"):
+            st.session_state.report_requests[request_key] = save_change(reports.request_report,
+                                                                        project_data["id"], month)
+        path = st.session_state.report_requests.get(request_key)
+        if path:
+            if path != reports.report_path(project_data["id"], month):
+                st.info("The project has changed since this report was requested. Generate it again to update it.")
+            status, error = reports.report_status(path)
+            if status == "running":
+                poll_report(path)
+            elif status == "failed":
+                st.error(f"Report failed: {error}")
+            else:
+                try:
+                    with open(path, "rb") as report:
+                        st.download_button("Download Report", report,
+                                           f"{selected_project} {month} report.pdf", "application/pdf")
+                except FileNotFoundError:
+                    # A newer version of the report replaced this one
+                    st.info("This report is out of date. Generate it again to get the latest version.")
+    else:
+        st.info("No projects available. Please register a new project.")
+
+
+# Check on a rendering report every few seconds without rerunning the page, then rerun it once done
+
+
+@st.fragment(run_every=2)
+def poll_report(path):
+    if reports.report_status(path)[0] != "running":
+        st.rerun()
+    st.info("Rendering report... You can keep working; it will appear here when ready.")
+
+
+# Activity page: changes to claims and tasks across the portfolio, a month at a time
+
+
+def show_activity():
+    st.header("🕑 Activity")
+    st.write("Who changed which interim claims and tasks, and when.")
+    projects = load_projects()
+    today = pd.Timestamp.today()
+    months = pd.period_range(today - pd.DateOffset(months=23), today, freq="M")
+    month = st.selectbox("Month", list(reversed(months)), format_func=lambda period: period.strftime("%B %Y"))
+    col1, col2 = st.columns(2)
+    with col1:
+        project_name = st.selectbox("Project", ["All Projects"] + projects.names, key="activity_project")
+    with col2:
+        records = st.selectbox("Records", ["Claims and Tasks", "Claims", "Tasks"])
+
+    events = database.list_events(
+        project_id=None if project_name == "All Projects" else projects.by_name[project_name]["id"],
+        entity={"Claims": "claim", "Tasks": "task"}.get(records),
+        since=month.start_time.strftime("%Y-%m-%d"),
+        until=(month + 1).start_time.strftime("%Y-%m-%d"))
+    if not events:
+        st.info("No changes recorded in this month.")
+        return
+    table = events_table(events, with_records=True)
+    table["Project"] = table["Project"].map(lambda project_id: projects.by_id[project_id]["name"]
+                                            if project_id in projects.by_id else "Deleted Project")
+    table["Record"] = table["Record"].str.capitalize()
+    st.dataframe(table, hide_index=True)
+    if len(events) == database.EVENT_LIMIT:
+        st.caption(f"Showing the latest {database.EVENT_LIMIT} changes. Pick a project or record type to see more.")
+
+
+# Import / Export page
+
+
+def show_import_export():
+    st.header("🔄 Bulk Import & Export")
+    st.write("Move projects, tasks and interim claims in and out of the dashboard as CSV or Parquet files.")
+    entity = st.selectbox("Data", list(bulk.COLUMNS))
+    file_format = st.radio("File Format", ["CSV", "Parquet"], horizontal=True)
+    extension = file_format.lower()
+
+    # Export everything to a file on disk, written batch by batch
+    st.subheader(f"Export {entity}")
+    if st.button(f"Prepare {entity} Export"):
+        path = bulk.export_file(entity, file_format)
+        try:
+            with open(path, "rb") as export:
+                st.download_button(f"Download {entity} {file_format}", export, f"{entity.lower()}.{extension}",
+                                   "text/csv" if file_format == "CSV" else "application/vnd.apache.parquet")
+        finally:
+            os.remove(path)
+
+    # Import, checked and written in batches
+    st.subheader(f"Import {entity}")
+    st.write(f"Expected columns: {', '.join(bulk.COLUMNS[entity])}")
+    uploaded_file = st.file_uploader(f"Upload {entity} {file_format}", type=[extension])
+    if uploaded_file:
+        col1, col2 = st.columns(2)
+        check_only = col1.button("Check File")
+        if check_only or col2.button("Import"):
+            try:
+                result = bulk.import_file(uploaded_file, entity, file_format, dry_run=check_only,
+                                          changed_by=st.session_state.username)
+            except ValueError as e:
+                st.error(f"Could not read {uploaded_file.name}: {e}")
+            except Exception as e:
+                st.error(f"Error saving projects: {e}")
+            else:
+                if check_only:
+                    st.success(f"{result['imported']} rows are ready to import.")
                 else:
-                    st.info("No interim claims found for this project.")
-
-            # Claim History or Audit Trail
-            if project_data["interim_claims"]:
-                st.subheader("Claim History / Audit Trail")
-                # Updated for handling missing 'notes'
-                audit_data = []
-                for claim in project_data["interim_claims"]:
-                    audit_data.append({
-                        "Claim Amount": claim["amount"],
-                        "Status": claim["status"],
-                        "Payment Schedule": claim["payment_schedule"],
-                        "Notes": claim.get("notes", "No notes provided")
-                        # Using get to avoid errors if 'notes' is missing
-                    })
-
-                if audit_data:
-                    audit_df = pd.DataFrame(audit_data)
-                    st.write(audit_df)
+                    st.success(f"{result['imported']} rows imported from {uploaded_file.name}.")
+                if result["rejected"]:
+                    st.warning(f"{result['rejected']} rows have problems and are not imported.")
+                    st.dataframe(pd.DataFrame({"Problem": result["errors"]}), hide_index=True)
+
+
+# Performance page for admins: rerun timings from profiled sessions
+
+
+def show_performance():
+    st.header("⏱ Performance")
+    st.write("Timings of page reruns, data loads, saves, DataFrame and chart builds, and widget counts.")
+    if instrumentation.ALWAYS_ON:
+        st.info("Profiling is on for every session.")
+    else:
+        st.info("Profiling is on for sessions that switch on 'Profile Reruns' in the sidebar.")
+
+    show_all = st.checkbox("Include Every User's Sessions", value=True)
+    records = instrumentation.recent_reruns(None if show_all else st.session_state.username)
+    if not records:
+        st.info("No profiled reruns yet. Switch on 'Profile Reruns' and open a few pages.")
+        return
+
+    # The latest profiled rerun in full
+    latest = records[-1]
+    st.subheader(f"Latest Rerun: {latest['page']}")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Total", f"{latest['total_ms']:.0f} ms")
+    col2.metric("Widgets", latest["widgets"])
+    col3.metric("When", latest["time"][11:])
+    if latest["timings"]:
+        st.dataframe(pd.DataFrame(sorted(latest["timings"].items(), key=lambda item: -item[1]),
+                                  columns=["Section", "ms"]), hide_index=True)
+
+    # Percentiles over the recent reruns
+    st.subheader(f"Percentiles over {len(records)} Reruns")
+    st.dataframe(pd.DataFrame(instrumentation.percentiles(records)), hide_index=True, column_config={
+        "name": "Section",
+        "count": "Samples",
+        "p50": "p50",
+        "p90": "p90",
+        "p99": "p99",
+        "max": "Max"
+    })
+    st.caption(f"Every profiled rerun is also logged as a JSON line to {instrumentation.LOG_FILE}.")
+
+
+# Display Login/Register if not logged in
+
+
+if not st.session_state.logged_in:
+    login_register()
+else:
+    # Load the page libraries in the background while the user picks a page
+    lazy_imports.prewarm()
+    st.sidebar.header(f"👋 Welcome, {st.session_state.username}!")
+    if st.sidebar.button("Logout"):
+        st.session_state.logged_in = False
+        st.rerun()
+
+    # Admins can profile their own reruns; CIVITAS_PROFILING=1 profiles every session
+    is_admin = st.session_state.user_role == "Admin"
+    if is_admin:
+        st.sidebar.toggle("Profile Reruns", key="profile_reruns")
+    profiling = instrumentation.ALWAYS_ON or (is_admin and st.session_state.get("profile_reruns", False))
+
+    # Dashboard sections; only the selected page runs on each rerun
+    pages = [
+        st.Page(show_project_overview, title="Project Overview", icon="📂", url_path="project-overview",
+                default=True),
+        st.Page(show_progress_tracking, title="Progress Tracking", icon="📊", url_path="progress-tracking"),
+        st.Page(show_financials, title="Financials", icon="💰", url_path="financials"),
+        st.Page(show_task_management, title="Task Management", icon="✅", url_path="task-management"),
+        st.Page(show_documents, title="Documents", icon="📄", url_path="documents"),
+        st.Page(show_interim_claims, title="Interim Claims", icon="💼", url_path="interim-claims"),
+        st.Page(show_reports, title="Reports", icon="📑", url_path="reports"),
+        st.Page(show_activity, title="Activity", icon="🕑", url_path="activity"),
+        st.Page(show_import_export, title="Import / Export", icon="🔄", url_path="import-export")
+    ]
+    if is_admin:
+        pages.append(st.Page(show_performance, title="Performance", icon="⏱", url_path="performance"))
+    page = st.navigation(pages)
+    with instrumentation.profile_rerun(page.title, st.session_state.username,
+                                       lambda: len(get_script_run_ctx().widget_ids_this_run), profiling):
+        page.run()
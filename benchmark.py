@@ -0,0 +1,335 @@
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, APP_DIR)
+
+import blob_store  # noqa: E402
+import claims  # noqa: E402
+import database  # noqa: E402
+import task_search  # noqa: E402
+from project_index import ProjectIndex  # noqa: E402
+
+# Dashboard pages timed as full reruns, by URL path
+PAGES = ["project-overview", "progress-tracking", "financials", "task-management", "documents", "interim-claims",
+         "reports", "activity", "import-export", "performance"]
+
+# A case is a regression when its median is this much slower than the baseline, and by at least
+# the absolute margin, so sub-millisecond noise never fails a run
+REGRESSION_TOLERANCE = 0.25
+REGRESSION_MARGIN_MS = 5.0
+
+# Startup budgets, measured in a fresh interpreter: the logged-out rerun must not load the page
+# libraries, and both it and the background pre-warm after login must finish in time
+LOGIN_FORBIDDEN_MODULES = ["pandas", "plotly.express", "pyarrow", "fpdf"]
+STARTUP_BUDGETS_MS = {"login rerun": 1000, "page library pre-warm": 3000}
+
+STARTUP_SCRIPT = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("App.py", default_timeout=120)
+started = time.perf_counter()
+app.run()
+login_ms = (time.perf_counter() - started) * 1000
+loaded = [name for name in sys.argv[1:] if name in sys.modules]
+import lazy_imports
+started = time.perf_counter()
+lazy_imports._import_all()
+prewarm_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({"timings": {"login rerun": login_ms, "page library pre-warm": prewarm_ms}, "loaded": loaded,
+                  "exceptions": [str(exception.value) for exception in app.exception]}))
+"""
+
+# Task search at about a million tasks: each search's median must stay within the budget.
+# Searches are by text, and whether they are limited to one project.
+SEARCH_SCALE = {"projects": 100, "tasks": 10000, "comments": 1, "claims": 0, "documents": 0, "document_kb": 0}
+SEARCH_BUDGET_MS = 50
+SCALE_SEARCHES = {
+    "portfolio: slab": ("slab", False),
+    "portfolio: sl": ("sl", False),
+    "portfolio: ali": ("ali", False),
+    "portfolio: s": ("s", False),
+    "portfolio: no text": ("", False),
+    "project: slab pour": ("slab pour", True)
+}
+
+WORDS = ["slab", "column", "beam", "rebar", "formwork", "pour", "inspect", "survey", "drainage", "culvert",
+         "bearing", "parapet", "pile", "pier", "deck", "asphalt", "kerb", "lighting", "signage", "handover"]
+PEOPLE = ["Ali", "Siti", "Wong", "Raj", "Mei", "John", "Aminah", "Kumar"]
+
+
+# Link the app's modules into a scratch directory; the app keeps its database and documents
+# in the working directory
+
+
+def link_app(workdir):
+    for name in os.listdir(APP_DIR):
+        if name.endswith(".py"):
+            os.symlink(os.path.join(APP_DIR, name), os.path.join(workdir, name))
+
+
+# Fill an empty database in the working directory with a synthetic portfolio
+
+
+def generate_portfolio(config, seed=42):
+    rng = random.Random(seed)
+    start = datetime.date(2025, 1, 1)
+    database.init_db()
+    database.bulk_add_projects([{
+        "id": f"BM{number:04d}",
+        "name": f"Benchmark Project {number}",
+        "client": f"Client {number % 10}",
+        "start_date": start.isoformat(),
+        "end_date": (start + datetime.timedelta(days=730)).isoformat(),
+        "budget": float(rng.randint(1, 50) * 1000000)
+    } for number in range(config["projects"])])
+    project_ids = sorted(database.get_project_ids_by_code().values())
+
+    for project_id in project_ids:
+        tasks = []
+        for _ in range(config["tasks"]):
+            task_start = start + datetime.timedelta(days=rng.randint(0, 700))
+            tasks.append({
+                "project_id": project_id,
+                "task_name": " ".join(rng.sample(WORDS, 2)).capitalize(),
+                "assigned_to": rng.choice(PEOPLE),
+                "priority": rng.choice(["High", "Medium", "Low"]),
+                "start_date": task_start.isoformat(),
+                "deadline": (task_start + datetime.timedelta(days=rng.randint(1, 60))).isoformat(),
+                "status": rng.choice(["Pending", "In Progress", "Completed"]),
+                "description": " ".join(rng.choices(WORDS, k=8))
+            })
+        database.bulk_add_tasks(tasks)
+        database.bulk_add_claims([{
+            "project_id": project_id,
+            "amount": float(rng.randint(1000, 500000)),
+            "status": rng.choice(claims.CLAIM_STATUSES),
+            "payment_schedule": (start + datetime.timedelta(days=rng.randint(0, 700))).isoformat(),
+            "notes": " ".join(rng.choices(WORDS, k=4))
+        } for _ in range(config["claims"])])
+        for number in range(config["documents"]):
+            digest, size = blob_store.put(io.BytesIO(rng.randbytes(config["document_kb"] * 1024)))
+            database.add_document(project_id, {"name": f"document-{number}.pdf", "type": "application/pdf",
+                                               "size": size, "sha256": digest, "category": "Reports"})
+
+    with database.transaction() as conn:
+        task_ids = [row[0] for row in conn.execute("SELECT id FROM tasks")]
+        conn.executemany("INSERT INTO task_comments (task_id, comment) VALUES (?, ?)",
+                         [(task_id, " ".join(rng.choices(WORDS, k=6)))
+                          for task_id in task_ids for _ in range(config["comments"])])
+    return project_ids
+
+
+# Time a case after one warm-up run: median and p95 over the timed runs, and peak traced memory
+# over one more run
+
+
+def measure(case, repeat):
+    case()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        case()
+        timings.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    case()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    timings.sort()
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        "peak_mb": round(peak / 1024 / 1024, 2)
+    }
+
+
+# The hot paths of the dashboard, each a function of no arguments
+
+
+def build_cases(project_ids):
+    from streamlit.testing.v1 import AppTest
+    from streamlit.util import calc_md5
+
+    project_id = project_ids[len(project_ids) // 2]
+    index = ProjectIndex()
+    index.refresh()
+    claims_table = claims.build_claims_table(project_id)
+    task_ids = [task["id"] for task in database.list_tasks(project_id, limit=100)]
+    statuses = ["Pending", "In Progress", "Completed"]
+    claim_id = int(claims_table["id"].iloc[0])
+    month_start = datetime.date.today().replace(day=1).isoformat()
+    month_end = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+
+    cases = {
+        "load_projects (cold)": lambda: ProjectIndex().refresh(),
+        "load_projects (warm)": index.refresh,
+        "save: add_task": lambda: database.add_task(project_id, {
+            "task_name": "Benchmark task", "assigned_to": "Ali", "priority": "Medium", "start_date": "2025-06-01",
+            "deadline": "2025-06-30", "status": "Pending", "description": "added by the benchmark"}),
+        "save: update_task_status": lambda: database.update_task_status(random.choice(task_ids),
+                                                                        random.choice(statuses)),
+        "save: add_claim": lambda: database.add_claim(project_id, {
+            "amount": 1000.0, "status": "Pending", "payment_schedule": "2025-06-15", "notes": "benchmark"}),
+        "claims: build table": lambda: claims.build_claims_table(project_id),
+        "claims: search": lambda: claims.filter_claims(claims_table, "Approved", None, None, "rebar"),
+        "tasks: search project": lambda: task_search.search_tasks("slab pour", project_id),
+        "tasks: search portfolio": lambda: task_search.search_tasks("reb", None, ["Pending"], ["High"]),
+        "tasks: facets only": lambda: task_search.search_tasks("", None, ["In Progress"], ["Low"]),
+        "audit: claim history": lambda: database.list_events(entity="claim", entity_id=claim_id),
+        "audit: project month": lambda: database.list_events(project_id=project_id, since=month_start,
+                                                             until=month_end),
+        "audit: portfolio month": lambda: database.list_events(since=month_start, until=month_end)
+    }
+
+    # Full reruns of each page as a logged-in admin. Page switching uses AppTest's page hash,
+    # which is how st.navigation picks the page for a rerun.
+    app = AppTest.from_file(os.path.join(os.getcwd(), "App.py"), default_timeout=120)
+    app.session_state["logged_in"] = True
+    app.session_state["user_role"] = "Admin"
+    app.session_state["username"] = "benchmark"
+    app.run()
+    for page in PAGES:
+        def rerun(page=page):
+            app._page_hash = calc_md5(page)
+            app.run()
+            if app.exception:
+                raise RuntimeError(f"{page} raised {app.exception[0].value}")
+        cases[f"rerun: {page}"] = rerun
+    return cases
+
+
+def print_results(results, baseline=None):
+    print(f"{'case':32} {'median ms':>10} {'p95 ms':>10} {'peak MB':>9} {'baseline':>10} {'change':>8}")
+    for case, result in results.items():
+        line = f"{case:32} {result['median_ms']:10.2f} {result['p95_ms']:10.2f} {result['peak_mb']:9.2f}"
+        previous = (baseline or {}).get(case)
+        if previous:
+            change = (result["median_ms"] - previous["median_ms"]) / max(previous["median_ms"], 0.01)
+            line += f" {previous['median_ms']:10.2f} {change:+8.0%}"
+        print(line)
+
+
+def find_regressions(results, baseline):
+    return [case for case, result in results.items() if case in baseline
+            and result["median_ms"] > baseline[case]["median_ms"] * (1 + REGRESSION_TOLERANCE)
+            and result["median_ms"] - baseline[case]["median_ms"] > REGRESSION_MARGIN_MS]
+
+
+# Check the startup budgets and return the problems found
+
+
+def check_startup():
+    with tempfile.TemporaryDirectory(prefix="civitas-startup-") as workdir:
+        link_app(workdir)
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT, *LOGIN_FORBIDDEN_MODULES], cwd=workdir,
+                                capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    problems = [f"login rerun raised {exception}" for exception in result["exceptions"]]
+    if result["loaded"]:
+        problems.append(f"login rerun imported {', '.join(result['loaded'])}")
+    for name, elapsed in result["timings"].items():
+        print(f"{name:32} {elapsed:10.2f} ms   budget {STARTUP_BUDGETS_MS[name]} ms")
+        if elapsed > STARTUP_BUDGETS_MS[name]:
+            problems.append(f"{name} took {elapsed:.0f} ms")
+    return problems
+
+
+# Time the searches on a portfolio of SEARCH_SCALE and return the ones over budget
+
+
+def check_search_at_scale(repeat):
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="civitas-search-") as workdir:
+        link_app(workdir)
+        os.chdir(workdir)
+        try:
+            started = time.perf_counter()
+            project_ids = generate_portfolio(SEARCH_SCALE)
+            print(f"Generated {SEARCH_SCALE} in {time.perf_counter() - started:.1f}s")
+            project_id = project_ids[len(project_ids) // 2]
+            results = {}
+            for name, (text, in_project) in SCALE_SEARCHES.items():
+                def search(text=text, in_project=in_project):
+                    task_search.search_tasks(text, project_id if in_project else None)
+                results[name] = measure(search, repeat)
+        finally:
+            os.chdir(original_dir)
+    print_results(results)
+    return [f"{name} took {result['median_ms']:.0f} ms" for name, result in results.items()
+            if result["median_ms"] > SEARCH_BUDGET_MS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the dashboard's hot paths on a synthetic portfolio.")
+    parser.add_argument("--projects", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200, help="tasks per project")
+    parser.add_argument("--comments", type=int, default=1, help="comments per task")
+    parser.add_argument("--claims", type=int, default=100, help="claims per project")
+    parser.add_argument("--documents", type=int, default=5, help="documents per project")
+    parser.add_argument("--document-kb", type=int, default=64, help="size of each document")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per case")
+    parser.add_argument("--save-baseline", metavar="FILE", help="write the results as a baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--startup", action="store_true", help="only check the startup budgets")
+    parser.add_argument("--search-scale", action="store_true",
+                        help="only check task search against its budget at about a million tasks")
+    args = parser.parse_args()
+    if args.search_scale:
+        problems = check_search_at_scale(args.repeat)
+        if problems:
+            print(f"Search over {SEARCH_BUDGET_MS} ms: {'; '.join(problems)}")
+            sys.exit(1)
+        return
+    if args.startup:
+        problems = check_startup()
+        if problems:
+            print(f"Startup over budget: {'; '.join(problems)}")
+            sys.exit(1)
+        return
+    config = {key: getattr(args, key) for key in ("projects", "tasks", "comments", "claims", "documents",
+                                                  "document_kb")}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            saved = json.load(file)
+        if saved["config"] != config:
+            print(f"Warning: baseline was recorded with {saved['config']}")
+        baseline = saved["results"]
+
+    original_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="civitas-benchmark-") as workdir:
+        link_app(workdir)
+        os.chdir(workdir)
+        try:
+            started = time.perf_counter()
+            project_ids = generate_portfolio(config)
+            print(f"Generated {config} in {time.perf_counter() - started:.1f}s")
+            results = {case: measure(run, args.repeat) for case, run in build_cases(project_ids).items()}
+        finally:
+            os.chdir(original_dir)
+
+    print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({"config": config, "results": results}, file, indent=2)
+        print(f"Baseline saved to {args.save_baseline}")
+    if baseline:
+        regressions = find_regressions(results, baseline)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
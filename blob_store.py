@@ -0,0 +1,73 @@
+import hashlib
+import mmap
+import os
+import tempfile
+
+BLOB_DIR = "document_store"
+CHUNK_SIZE = 1024 * 1024
+
+
+# Blobs are stored by SHA-256, fanned out by the first two hex digits
+
+
+def blob_path(digest):
+    return os.path.join(BLOB_DIR, digest[:2], digest)
+
+
+def exists(digest):
+    return os.path.exists(blob_path(digest))
+
+
+# Copy a file-like object into the store in chunks and return its hash and size.
+# Content that is already stored is not written twice.
+
+
+def put(fileobj):
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(dir=BLOB_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        path = blob_path(digest.hexdigest())
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return digest.hexdigest(), size
+
+
+# Memory-map a stored blob read-only
+
+
+def open_mapped(digest):
+    with open(blob_path(digest), "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+# Read a blob through a memory map, for APIs that need bytes
+
+
+def read(digest):
+    if os.path.getsize(blob_path(digest)) == 0:
+        return b""
+    with open_mapped(digest) as mapped:
+        return mapped[:]
+
+
+def delete(digest):
+    try:
+        os.remove(blob_path(digest))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,230 @@
+import datetime
+import math
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+import database
+from claims import CLAIM_STATUSES
+
+# Rows read, checked and written per batch, so memory stays flat whatever the file size
+BATCH_SIZE = 5000
+CSV_BLOCK_SIZE = 1024 * 1024
+# Errors listed per import; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+TASK_PRIORITIES = ["High", "Medium", "Low"]
+TASK_STATUSES = ["Pending", "In Progress", "Completed"]
+
+# Columns of each bulk file. Tasks and claims name their project by its code.
+COLUMNS = {
+    "Projects": ["code", "name", "client", "start_date", "end_date", "budget"],
+    "Tasks": ["project_code", "task_name", "assigned_to", "priority", "start_date", "deadline", "status",
+              "description"],
+    "Claims": ["project_code", "amount", "status", "payment_schedule", "notes"]
+}
+
+EXPORT_QUERIES = {
+    "Projects": "SELECT project_code, project_title, client_name, start_date, end_date, budget FROM projects "
+                "ORDER BY id",
+    "Tasks": "SELECT projects.project_code, task_name, assigned_to, priority, tasks.start_date, tasks.end_date, "
+             "status, description FROM tasks JOIN projects ON projects.id = tasks.project_id ORDER BY tasks.id",
+    "Claims": "SELECT projects.project_code, amount, status, payment_schedule, notes FROM interim_claims "
+              "JOIN projects ON projects.id = interim_claims.project_id ORDER BY interim_claims.id"
+}
+
+EXPORT_SCHEMAS = {
+    entity: pa.schema([(column, pa.float64() if column in ("budget", "amount") else pa.string())
+                       for column in columns])
+    for entity, columns in COLUMNS.items()
+}
+
+
+# Stream a query's rows out in Arrow batches
+
+
+def _export_batches(entity):
+    cursor = database.get_connection().execute(EXPORT_QUERIES[entity])
+    schema = EXPORT_SCHEMAS[entity]
+    for rows in iter(lambda: cursor.fetchmany(BATCH_SIZE), []):
+        yield pa.RecordBatch.from_arrays([pa.array(column, type=field.type)
+                                          for column, field in zip(zip(*rows), schema)], schema=schema)
+
+
+# Write every row of an entity to a temporary CSV or Parquet file and return its path.
+# The caller removes the file.
+
+
+def export_file(entity, file_format):
+    fd, path = tempfile.mkstemp(suffix=f".{file_format.lower()}")
+    os.close(fd)
+    schema = EXPORT_SCHEMAS[entity]
+    writer_class = pa_csv.CSVWriter if file_format == "CSV" else pq.ParquetWriter
+    try:
+        with writer_class(path, schema) as writer:
+            for batch in _export_batches(entity):
+                writer.write_batch(batch)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+# Read an uploaded file in batches of rows as dicts, every value as text
+
+
+def _import_batches(fileobj, file_format, columns):
+    if file_format == "CSV":
+        read_options = pa_csv.ReadOptions(block_size=CSV_BLOCK_SIZE)
+        header = pa_csv.open_csv(fileobj, read_options=read_options).schema.names
+        missing = [column for column in columns if column not in header]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        fileobj.seek(0)
+        reader = pa_csv.open_csv(
+            fileobj, read_options=read_options,
+            convert_options=pa_csv.ConvertOptions(column_types={column: pa.string() for column in header},
+                                                  include_columns=columns))
+        batches = reader
+    else:
+        parquet_file = pq.ParquetFile(fileobj)
+        missing = [column for column in columns if column not in parquet_file.schema_arrow.names]
+        if missing:
+            raise ValueError(f"Missing columns: {', '.join(missing)}")
+        batches = parquet_file.iter_batches(batch_size=BATCH_SIZE, columns=columns)
+    for batch in batches:
+        rows = batch.to_pylist()
+        for start in range(0, len(rows), BATCH_SIZE):
+            yield [{column: _text(value) for column, value in row.items()}
+                   for row in rows[start:start + BATCH_SIZE]]
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()[:10]
+    return str(value).strip()
+
+
+def _date(value, column, required=True):
+    if not value:
+        if required:
+            raise ValueError(f"{column} is required")
+        return None
+    try:
+        return datetime.date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"{column} '{value}' is not a YYYY-MM-DD date") from None
+
+
+def _amount(value, column):
+    try:
+        amount = float(value)
+    except ValueError:
+        raise ValueError(f"{column} '{value}' is not a number") from None
+    if not math.isfinite(amount):
+        raise ValueError(f"{column} '{value}' is not a finite number")
+    if amount < 0:
+        raise ValueError(f"{column} cannot be negative")
+    return amount
+
+
+def _choice(value, column, choices):
+    if value not in choices:
+        raise ValueError(f"{column} '{value}' must be one of {', '.join(choices)}")
+    return value
+
+
+# Row checks: each returns the record to store or raises ValueError naming the problem
+
+
+def _check_project(row, context):
+    if not row["code"] or not row["name"] or not row["client"]:
+        raise ValueError("code, name and client are required")
+    if row["name"] in context["names"]:
+        raise ValueError(f"a project named {row['name']} already exists")
+    project = {
+        "id": row["code"],
+        "name": row["name"],
+        "client": row["client"],
+        "start_date": _date(row["start_date"], "start_date"),
+        "end_date": _date(row["end_date"], "end_date"),
+        "budget": _amount(row["budget"], "budget")
+    }
+    if project["end_date"] < project["start_date"]:
+        raise ValueError("end_date is before start_date")
+    context["names"].add(row["name"])
+    return project
+
+
+def _project_id(row, context):
+    if row["project_code"] not in context["project_ids"]:
+        raise ValueError(f"no project with code '{row['project_code']}'")
+    return context["project_ids"][row["project_code"]]
+
+
+def _check_task(row, context):
+    if not row["task_name"]:
+        raise ValueError("task_name is required")
+    task = {
+        "project_id": _project_id(row, context),
+        "task_name": row["task_name"],
+        "assigned_to": row["assigned_to"],
+        "priority": _choice(row["priority"], "priority", TASK_PRIORITIES),
+        "start_date": _date(row["start_date"], "start_date", required=False),
+        "deadline": _date(row["deadline"], "deadline"),
+        "status": _choice(row["status"] or "Pending", "status", TASK_STATUSES),
+        "description": row["description"]
+    }
+    if task["start_date"] and task["deadline"] < task["start_date"]:
+        raise ValueError("deadline is before start_date")
+    return task
+
+
+def _check_claim(row, context):
+    return {
+        "project_id": _project_id(row, context),
+        "amount": _amount(row["amount"], "amount"),
+        "status": _choice(row["status"] or "Pending", "status", CLAIM_STATUSES),
+        "payment_schedule": _date(row["payment_schedule"], "payment_schedule"),
+        "notes": row["notes"]
+    }
+
+
+# Row check and batch writer for each entity. Writers take the importing user for the audit log,
+# which covers tasks and claims.
+IMPORTERS = {
+    "Projects": (_check_project, lambda projects, changed_by: database.bulk_add_projects(projects)),
+    "Tasks": (_check_task, database.bulk_add_tasks),
+    "Claims": (_check_claim, database.bulk_add_claims)
+}
+
+
+# Stream a CSV or Parquet upload into the store. Each batch is checked row by row; valid rows
+# are written in one transaction per batch and invalid ones are reported by row number.
+# With dry_run nothing is written. Imported tasks and claims are logged as changed by changed_by.
+
+
+def import_file(fileobj, entity, file_format, dry_run=False, changed_by=None):
+    check, write = IMPORTERS[entity]
+    context = {"names": database.get_project_names(), "project_ids": database.get_project_ids_by_code()}
+    result = {"imported": 0, "rejected": 0, "errors": []}
+    row_number = 0
+    for rows in _import_batches(fileobj, file_format, COLUMNS[entity]):
+        records = []
+        for row in rows:
+            row_number += 1
+            try:
+                records.append(check(row, context))
+            except ValueError as e:
+                result["rejected"] += 1
+                if len(result["errors"]) < MAX_REPORTED_ERRORS:
+                    result["errors"].append(f"Row {row_number}: {e}")
+        if records and not dry_run:
+            write(records, changed_by)
+        result["imported"] += len(records)
+    return result
@@ -0,0 +1,56 @@
+import pandas as pd
+
+import database
+
+CLAIM_STATUSES = ["Pending", "Approved", "Rejected"]
+
+DISPLAY_COLUMNS = {
+    "amount": "Claim Amount ($)",
+    "status": "Claim Status",
+    "payment_schedule": "Payment Schedule",
+    "notes": "Claim Notes"
+}
+
+
+# Load a project's claims as a columnar table, numbered from 1 like the claim list.
+# search_text holds every field in lower case so free-text search is a single column scan.
+
+
+def build_claims_table(project_id):
+    table = pd.read_sql_query(
+        "SELECT id, amount, status, payment_schedule, notes, version FROM interim_claims WHERE project_id = ? "
+        "ORDER BY id", database.get_connection(), params=(project_id,))
+    table.index = pd.RangeIndex(1, len(table) + 1)
+    table["amount"] = table["amount"].astype("float64")
+    table["status"] = pd.Categorical(table["status"], categories=CLAIM_STATUSES)
+    table["payment_schedule"] = pd.to_datetime(table["payment_schedule"], errors="coerce")
+    table["notes"] = table["notes"].fillna("").astype("string[pyarrow]")
+    table["search_text"] = (table["amount"].astype(str) + " " + table["status"].astype(str) + " "
+                            + table["payment_schedule"].dt.strftime("%Y-%m-%d").fillna("") + " "
+                            + table["notes"]).str.lower().astype("string[pyarrow]")
+    return table
+
+
+# Filter a claims table with vectorized column operations
+
+
+def filter_claims(table, status="All", amount_range=None, date_range=None, search_term=""):
+    mask = pd.Series(True, index=table.index)
+    if status != "All":
+        mask &= table["status"] == status
+    if amount_range:
+        mask &= table["amount"].between(amount_range[0], amount_range[1])
+    if date_range:
+        mask &= table["payment_schedule"].between(pd.Timestamp(date_range[0]), pd.Timestamp(date_range[1]))
+    if search_term:
+        mask &= table["search_text"].str.contains(search_term.lower(), regex=False)
+    return table[mask]
+
+
+# Shape a claims table for display, dropping internal columns
+
+
+def display_claims(table):
+    display = table[list(DISPLAY_COLUMNS)].rename(columns=DISPLAY_COLUMNS)
+    display["Payment Schedule"] = display["Payment Schedule"].dt.date
+    return display
@@ -0,0 +1,837 @@
+import io
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import blob_store
+import storage
+
+DB_FILE = "civitas_dashboard.db"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = False
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_title TEXT NOT NULL,
+        project_manager TEXT,
+        client_name TEXT,
+        budget REAL
+    );
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER,
+        task_name TEXT,
+        start_date TEXT,
+        end_date TEXT,
+        status TEXT
+    );
+    CREATE TABLE IF NOT EXISTS progress (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER,
+        completed_percent INTEGER
+    );
+    """,
+    """
+    ALTER TABLE projects ADD COLUMN project_code TEXT;
+    ALTER TABLE projects ADD COLUMN start_date TEXT;
+    ALTER TABLE projects ADD COLUMN end_date TEXT;
+    ALTER TABLE projects ADD COLUMN progress INTEGER DEFAULT 0;
+    ALTER TABLE tasks ADD COLUMN assigned_to TEXT;
+    ALTER TABLE tasks ADD COLUMN priority TEXT;
+    ALTER TABLE tasks ADD COLUMN description TEXT;
+    CREATE TABLE task_comments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task_id INTEGER NOT NULL,
+        comment TEXT
+    );
+    CREATE TABLE documents (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER NOT NULL,
+        name TEXT,
+        type TEXT,
+        content BLOB
+    );
+    CREATE TABLE interim_claims (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER NOT NULL,
+        amount REAL,
+        status TEXT,
+        payment_schedule TEXT,
+        notes TEXT
+    );
+    CREATE INDEX idx_tasks_project ON tasks (project_id, status);
+    CREATE INDEX idx_tasks_status_deadline ON tasks (status, end_date);
+    CREATE INDEX idx_task_comments_task ON task_comments (task_id);
+    CREATE INDEX idx_documents_project ON documents (project_id);
+    CREATE INDEX idx_claims_project ON interim_claims (project_id, status);
+    CREATE INDEX idx_claims_status_payment ON interim_claims (status, payment_schedule);
+    """,
+    """
+    CREATE TABLE store_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    );
+    INSERT INTO store_version (id, version) VALUES (1, 0);
+    """,
+    """
+    ALTER TABLE store_version ADD COLUMN projects_version INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    ALTER TABLE documents ADD COLUMN sha256 TEXT;
+    ALTER TABLE documents ADD COLUMN size INTEGER;
+    ALTER TABLE documents ADD COLUMN category TEXT;
+    DROP INDEX idx_documents_project;
+    CREATE INDEX idx_documents_project ON documents (project_id, sha256);
+    CREATE INDEX idx_documents_sha256 ON documents (sha256);
+    """,
+    """
+    ALTER TABLE projects ADD COLUMN claims_version INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    CREATE VIRTUAL TABLE task_search USING fts5(
+        task_name, description, assigned_to, comments, project_id, status, priority, prefix='2 3 4 5 6'
+    );
+    INSERT INTO task_search (task_search, rank) VALUES ('rank', 'bm25(10.0, 2.0, 5.0, 1.0, 0.0, 0.0, 0.0)');
+    INSERT INTO task_search (rowid, task_name, description, assigned_to, comments, project_id, status, priority)
+        SELECT id, task_name, description, assigned_to,
+               (SELECT group_concat(comment, ' ') FROM task_comments WHERE task_id = tasks.id),
+               project_id, status, priority
+        FROM tasks;
+    CREATE TRIGGER task_search_insert AFTER INSERT ON tasks BEGIN
+        INSERT INTO task_search (rowid, task_name, description, assigned_to, comments, project_id, status, priority)
+        VALUES (new.id, new.task_name, new.description, new.assigned_to, '', new.project_id, new.status,
+                new.priority);
+    END;
+    CREATE TRIGGER task_search_update
+    AFTER UPDATE OF task_name, description, assigned_to, project_id, status, priority ON tasks BEGIN
+        UPDATE task_search SET task_name = new.task_name, description = new.description,
+                               assigned_to = new.assigned_to, project_id = new.project_id, status = new.status,
+                               priority = new.priority
+        WHERE rowid = new.id;
+    END;
+    CREATE TRIGGER task_search_delete AFTER DELETE ON tasks BEGIN
+        DELETE FROM task_search WHERE rowid = old.id;
+    END;
+    CREATE TRIGGER task_search_comment AFTER INSERT ON task_comments BEGIN
+        UPDATE task_search SET comments = comments || ' ' || new.comment WHERE rowid = new.task_id;
+    END;
+    CREATE INDEX idx_tasks_priority_deadline ON tasks (priority, end_date);
+    """,
+    """
+    CREATE INDEX idx_tasks_project_deadline ON tasks (project_id, end_date);
+    """,
+    """
+    ALTER TABLE projects ADD COLUMN tasks_version INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    ALTER TABLE progress ADD COLUMN element TEXT;
+    ALTER TABLE progress ADD COLUMN recorded_at TEXT;
+    ALTER TABLE progress ADD COLUMN recorded_by TEXT;
+    CREATE INDEX idx_progress_project ON progress (project_id, element, recorded_at);
+    CREATE TABLE progress_daily (
+        project_id INTEGER NOT NULL,
+        element TEXT NOT NULL,
+        day TEXT NOT NULL,
+        completed_percent INTEGER,
+        updated_at TEXT,
+        PRIMARY KEY (project_id, element, day)
+    ) WITHOUT ROWID;
+    CREATE TABLE progress_weekly (
+        project_id INTEGER NOT NULL,
+        element TEXT NOT NULL,
+        week TEXT NOT NULL,
+        completed_percent INTEGER,
+        PRIMARY KEY (project_id, element, week)
+    ) WITHOUT ROWID;
+    """,
+    """
+    CREATE TABLE financial_totals (
+        scope TEXT NOT NULL,
+        scope_key TEXT NOT NULL,
+        month TEXT NOT NULL,
+        status TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        claim_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_key, month, status)
+    ) WITHOUT ROWID;
+    INSERT INTO financial_totals
+        SELECT 'project', CAST(id AS TEXT), '', 'Budget', COALESCE(SUM(budget), 0), 0 FROM projects GROUP BY id;
+    INSERT INTO financial_totals
+        SELECT 'client', COALESCE(client_name, ''), '', 'Budget', COALESCE(SUM(budget), 0), 0
+        FROM projects GROUP BY COALESCE(client_name, '');
+    INSERT INTO financial_totals
+        SELECT 'portfolio', '', '', 'Budget', COALESCE(SUM(budget), 0), 0 FROM projects;
+    INSERT INTO financial_totals
+        SELECT 'project', CAST(project_id AS TEXT), COALESCE(substr(payment_schedule, 1, 7), ''), status,
+               SUM(amount), COUNT(*)
+        FROM interim_claims GROUP BY 2, 3, 4;
+    INSERT INTO financial_totals
+        SELECT 'client', COALESCE(projects.client_name, ''), COALESCE(substr(payment_schedule, 1, 7), ''),
+               interim_claims.status, SUM(amount), COUNT(*)
+        FROM interim_claims JOIN projects ON projects.id = interim_claims.project_id GROUP BY 2, 3, 4;
+    INSERT INTO financial_totals
+        SELECT 'portfolio', '', COALESCE(substr(payment_schedule, 1, 7), ''), status, SUM(amount), COUNT(*)
+        FROM interim_claims GROUP BY 3, 4;
+    """,
+    """
+    ALTER TABLE tasks ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+    ALTER TABLE interim_claims ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+    """,
+    """
+    CREATE TABLE audit_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project_id INTEGER NOT NULL,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        action TEXT NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        detail TEXT,
+        changed_by TEXT,
+        changed_at TEXT NOT NULL
+    );
+    CREATE INDEX idx_audit_entity ON audit_events (entity, entity_id, changed_at);
+    CREATE INDEX idx_audit_project ON audit_events (project_id, changed_at);
+    CREATE INDEX idx_audit_time ON audit_events (changed_at);
+    CREATE TRIGGER audit_events_no_update BEFORE UPDATE ON audit_events BEGIN
+        SELECT RAISE(ABORT, 'audit events cannot be changed');
+    END;
+    CREATE TRIGGER audit_events_no_delete BEFORE DELETE ON audit_events BEGIN
+        SELECT RAISE(ABORT, 'audit events cannot be deleted');
+    END;
+    INSERT INTO audit_events (project_id, entity, entity_id, action, new_value, detail, changed_at)
+        SELECT project_id, 'claim', id, 'Recorded', status, printf('$%.2f', amount), datetime('now', 'localtime')
+        FROM interim_claims;
+    INSERT INTO audit_events (project_id, entity, entity_id, action, new_value, detail, changed_at)
+        SELECT project_id, 'task', id, 'Recorded', status, task_name, datetime('now', 'localtime') FROM tasks;
+    """,
+    """
+    ALTER TABLE store_version ADD COLUMN legacy_imported INTEGER NOT NULL DEFAULT 0;
+    UPDATE store_version SET legacy_imported = 1 WHERE version > 0 OR EXISTS (SELECT 1 FROM projects);
+    """,
+    """
+    DROP TRIGGER task_search_comment;
+    CREATE TRIGGER task_search_comment AFTER INSERT ON task_comments BEGIN
+        UPDATE task_search SET comments = COALESCE(comments, '') || ' ' || new.comment WHERE rowid = new.task_id;
+    END;
+    UPDATE task_search SET comments = COALESCE(
+        (SELECT group_concat(comment, ' ') FROM task_comments WHERE task_id = task_search.rowid), '');
+    """,
+    """
+    DROP TABLE financial_totals;
+    CREATE TABLE financial_totals (
+        scope TEXT NOT NULL,
+        scope_key TEXT NOT NULL,
+        month TEXT NOT NULL,
+        status TEXT NOT NULL,
+        amount_cents INTEGER NOT NULL DEFAULT 0,
+        claim_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (scope, scope_key, month, status)
+    ) WITHOUT ROWID;
+    INSERT INTO financial_totals
+        SELECT 'project', CAST(id AS TEXT), '', 'Budget', COALESCE(CAST(ROUND(budget * 100) AS INTEGER), 0), 0
+        FROM projects;
+    INSERT INTO financial_totals
+        SELECT 'client', COALESCE(client_name, ''), '', 'Budget',
+               COALESCE(SUM(CAST(ROUND(budget * 100) AS INTEGER)), 0), 0
+        FROM projects GROUP BY COALESCE(client_name, '');
+    INSERT INTO financial_totals
+        SELECT 'portfolio', '', '', 'Budget', COALESCE(SUM(CAST(ROUND(budget * 100) AS INTEGER)), 0), 0
+        FROM projects;
+    INSERT INTO financial_totals
+        SELECT 'project', CAST(project_id AS TEXT), COALESCE(substr(payment_schedule, 1, 7), ''), status,
+               COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0), COUNT(*)
+        FROM interim_claims GROUP BY 2, 3, 4;
+    INSERT INTO financial_totals
+        SELECT 'client', COALESCE(projects.client_name, ''), COALESCE(substr(payment_schedule, 1, 7), ''),
+               interim_claims.status, COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0), COUNT(*)
+        FROM interim_claims JOIN projects ON projects.id = interim_claims.project_id GROUP BY 2, 3, 4;
+    INSERT INTO financial_totals
+        SELECT 'portfolio', '', COALESCE(substr(payment_schedule, 1, 7), ''), status,
+               COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0), COUNT(*)
+        FROM interim_claims GROUP BY 3, 4;
+    """,
+    """
+    CREATE INDEX idx_audit_entity_time ON audit_events (entity, changed_at);
+    """,
+    """
+    CREATE INDEX idx_tasks_deadline ON tasks (end_date);
+    """,
+]
+
+
+# Raised when a row was changed by someone else since the caller read it
+
+
+class ConflictError(Exception):
+    pass
+
+
+# Get this thread's connection to the database
+
+
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    return conn
+
+
+# Forget every thread's connection, so the next use opens a new one on the current DB_FILE
+
+
+def forget_connections():
+    global _local
+    _local = threading.local()
+
+
+# Run a write transaction. The write lock is taken up front, so what the transaction reads
+# cannot change before it writes.
+
+
+@contextmanager
+def transaction():
+    conn = get_connection()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+# Bumped only when projects are added or removed
+
+
+def _bump_projects_version(conn):
+    conn.execute("UPDATE store_version SET projects_version = projects_version + 1")
+
+
+def get_projects_version():
+    return get_connection().execute("SELECT projects_version FROM store_version").fetchone()[0]
+
+
+# Create or upgrade the schema, then import projects.json if it has never been imported. Any earlier
+# write to the database means it was, so a database whose projects were all deleted stays empty.
+
+
+def init_db():
+    global _initialized
+    with _init_lock:
+        if _initialized:
+            return
+        conn = get_connection()
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            conn.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
+        if not conn.execute("SELECT legacy_imported FROM store_version").fetchone()[0]:
+            import_projects(storage.load_portfolio())
+        _move_document_content(conn)
+        _initialized = True
+
+
+# Move document bytes stored inline by older versions into the blob store
+
+
+def _move_document_content(conn):
+    rows = conn.execute("SELECT id FROM documents WHERE content IS NOT NULL").fetchall()
+    for row in rows:
+        content = conn.execute("SELECT content FROM documents WHERE id = ?", (row["id"],)).fetchone()[0]
+        digest, size = blob_store.put(io.BytesIO(content))
+        with transaction():
+            conn.execute("UPDATE documents SET sha256 = ?, size = ?, content = NULL WHERE id = ?",
+                         (digest, size, row["id"]))
+
+
+# Import projects in the old JSON layout
+
+
+def import_projects(projects):
+    with transaction() as conn:
+        _bump_projects_version(conn)
+        conn.execute("UPDATE store_version SET legacy_imported = 1")
+        events = []
+        for project in projects:
+            project_id = _insert_project(conn, project)
+            for task in project.get("tasks", []):
+                task_id = _insert_task(conn, project_id, task)
+                events.append((project_id, "task", task_id, "Recorded", None, task["status"], task["task_name"]))
+                for comment in task.get("comments", []):
+                    conn.execute("INSERT INTO task_comments (task_id, comment) VALUES (?, ?)", (task_id, comment))
+            for claim in project.get("interim_claims", []):
+                claim_id = _insert_claim(conn, project_id, claim)
+                events.append((project_id, "claim", claim_id, "Recorded", None, claim["status"],
+                               f"${claim['amount']:.2f}"))
+        _log_events(conn, events, None)
+
+
+# Projects
+
+
+def _insert_project(conn, project):
+    cursor = conn.execute(
+        "INSERT INTO projects (project_title, project_code, client_name, start_date, end_date, budget, progress) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (project["name"], project["id"], project["client"], project["start_date"], project["end_date"],
+         project["budget"], project.get("progress", 0)))
+    _add_to_totals(conn, cursor.lastrowid, "", "Budget", _cents(project["budget"]), 0)
+    return cursor.lastrowid
+
+
+def add_project(project):
+    with transaction() as conn:
+        _bump_projects_version(conn)
+        return _insert_project(conn, project)
+
+
+def delete_project(project_id, changed_by=None):
+    with transaction() as conn:
+        _bump_projects_version(conn)
+        # The tasks and claims go with the project; their history stays and ends with the deletion
+        conn.execute(
+            "INSERT INTO audit_events (project_id, entity, entity_id, action, old_value, detail, changed_by, "
+            "changed_at) SELECT project_id, 'task', id, 'Deleted', status, task_name, ?, ? FROM tasks "
+            "WHERE project_id = ?", (changed_by, _now(), project_id))
+        conn.execute(
+            "INSERT INTO audit_events (project_id, entity, entity_id, action, old_value, detail, changed_by, "
+            "changed_at) SELECT project_id, 'claim', id, 'Deleted', status, printf('$%.2f', amount), ?, ? "
+            "FROM interim_claims WHERE project_id = ?", (changed_by, _now(), project_id))
+        digests = [row["sha256"] for row in
+                   conn.execute("SELECT DISTINCT sha256 FROM documents WHERE project_id = ?", (project_id,))]
+        conn.execute("DELETE FROM task_comments WHERE task_id IN (SELECT id FROM tasks WHERE project_id = ?)",
+                     (project_id,))
+        conn.execute("DELETE FROM tasks WHERE project_id = ?", (project_id,))
+        conn.execute("DELETE FROM documents WHERE project_id = ?", (project_id,))
+        conn.execute("DELETE FROM interim_claims WHERE project_id = ?", (project_id,))
+        _remove_from_totals(conn, project_id)
+        conn.execute("DELETE FROM progress WHERE project_id = ?", (project_id,))
+        conn.execute("DELETE FROM progress_daily WHERE project_id = ?", (project_id,))
+        conn.execute("DELETE FROM progress_weekly WHERE project_id = ?", (project_id,))
+        conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+    _delete_unused_content(digests)
+
+
+# Bulk inserts for file imports, one transaction per batch of records
+
+
+def bulk_add_projects(projects):
+    with transaction() as conn:
+        _bump_projects_version(conn)
+        for project in projects:
+            _insert_project(conn, project)
+
+
+def get_project_names():
+    return {row[0] for row in get_connection().execute("SELECT project_title FROM projects")}
+
+
+# Project codes to database IDs; the earliest project wins where codes repeat
+
+
+def get_project_ids_by_code():
+    return {row[0]: row[1] for row in
+            get_connection().execute("SELECT project_code, id FROM projects ORDER BY id DESC")}
+
+
+PROJECT_COLUMNS = ("id, project_title AS name, project_code AS code, client_name AS client, start_date, end_date, "
+                   "budget, progress")
+
+
+def list_projects():
+    rows = get_connection().execute(f"SELECT {PROJECT_COLUMNS} FROM projects ORDER BY id")
+    return [dict(row) for row in rows]
+
+
+def get_project(project_id):
+    row = get_connection().execute(f"SELECT {PROJECT_COLUMNS} FROM projects WHERE id = ?", (project_id,)).fetchone()
+    return dict(row) if row else None
+
+
+# Tasks
+
+
+def _insert_task(conn, project_id, task):
+    cursor = conn.execute(
+        "INSERT INTO tasks (project_id, task_name, assigned_to, priority, start_date, end_date, status, description) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (project_id, task["task_name"], task["assigned_to"], task["priority"],
+         str(task["start_date"]) if task.get("start_date") else None, str(task["deadline"]), task["status"],
+         task["description"]))
+    return cursor.lastrowid
+
+
+def add_task(project_id, task, changed_by=None):
+    with transaction() as conn:
+        conn.execute("UPDATE projects SET tasks_version = tasks_version + 1 WHERE id = ?", (project_id,))
+        task_id = _insert_task(conn, project_id, task)
+        _log_event(conn, project_id, "task", task_id, "Created", None, task["status"], task["task_name"], changed_by)
+        return task_id
+
+
+def bulk_add_tasks(tasks, changed_by=None):
+    with transaction() as conn:
+        conn.executemany("UPDATE projects SET tasks_version = tasks_version + 1 WHERE id = ?",
+                         [(project_id,) for project_id in {task["project_id"] for task in tasks}])
+        events = []
+        for task in tasks:
+            task_id = _insert_task(conn, task["project_id"], task)
+            events.append((task["project_id"], "task", task_id, "Imported", None, task["status"], task["task_name"]))
+        _log_events(conn, events, changed_by)
+
+
+# Sort orders offered for task lists, mapped to SQL so user input never reaches the query
+TASK_SORT_KEYS = {
+    "Created": "id",
+    "Deadline": "end_date",
+    "Priority": "CASE priority WHEN 'High' THEN 0 WHEN 'Medium' THEN 1 ELSE 2 END",
+    "Status": "status",
+    "Task Name": "task_name"
+}
+
+
+def list_tasks(project_id, sort_by="Created", descending=False, limit=-1, offset=0):
+    direction = "DESC" if descending else "ASC"
+    rows = get_connection().execute(
+        "SELECT id, task_name, assigned_to, priority, end_date AS deadline, status, description, version FROM tasks "
+        f"WHERE project_id = ? ORDER BY {TASK_SORT_KEYS[sort_by]} {direction}, id {direction} LIMIT ? OFFSET ?",
+        (project_id, limit, offset))
+    return [dict(row) for row in rows]
+
+
+def count_tasks(project_id):
+    return get_connection().execute("SELECT COUNT(*) FROM tasks WHERE project_id = ?", (project_id,)).fetchone()[0]
+
+
+# Status updates are compare-and-swap on the row version: an update based on an old read
+# of the task fails instead of overwriting a newer change. Without a version it always applies.
+# The read happens under the write lock and the update only applies to the version read, so
+# the status change, the audit event and the totals always start from the current row.
+# Returns the task's new version.
+
+
+def update_task_status(task_id, status, expected_version=None, changed_by=None):
+    with transaction() as conn:
+        task = conn.execute("SELECT project_id, task_name, status, version FROM tasks WHERE id = ?",
+                            (task_id,)).fetchone()
+        if task is None:
+            raise ConflictError(f"Task {task_id} was deleted by another user.")
+        if expected_version is not None and task["version"] != expected_version:
+            raise ConflictError(f"Task {task_id} was changed by another user and is now {task['status']}.")
+        updated = conn.execute("UPDATE tasks SET status = ?, version = version + 1 WHERE id = ? AND version = ?",
+                               (status, task_id, task["version"]))
+        if updated.rowcount == 0:
+            raise ConflictError(f"Task {task_id} was changed by another user.")
+        conn.execute("UPDATE projects SET tasks_version = tasks_version + 1 WHERE id = ?", (task["project_id"],))
+        _log_event(conn, task["project_id"], "task", task_id, "Status Changed", task["status"], status,
+                   task["task_name"], changed_by)
+        return task["version"] + 1
+
+
+# Bumped whenever a project's tasks change, to key cached timelines
+
+
+def get_tasks_version(project_id):
+    row = get_connection().execute("SELECT tasks_version FROM projects WHERE id = ?", (project_id,)).fetchone()
+    return row[0] if row else None
+
+
+def add_comment(task_id, comment, changed_by=None):
+    with transaction() as conn:
+        task = conn.execute("SELECT project_id FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        if task is None:
+            raise ConflictError(f"Task {task_id} was deleted by another user.")
+        conn.execute("INSERT INTO task_comments (task_id, comment) VALUES (?, ?)", (task_id, comment))
+        _log_event(conn, task["project_id"], "task", task_id, "Commented", None, None, comment, changed_by)
+
+
+def list_comments(task_id):
+    rows = get_connection().execute("SELECT comment FROM task_comments WHERE task_id = ? ORDER BY id", (task_id,))
+    return [row["comment"] for row in rows]
+
+
+# Progress
+
+
+# Append a progress reading and roll it into the daily and weekly series.
+# Each rollup keeps the last reading of its day or week (weeks start on Monday).
+
+
+def record_progress(project_id, element, completed_percent, recorded_by=None):
+    now = datetime.now()
+    recorded_at = now.isoformat(sep=" ", timespec="seconds")
+    day = now.date()
+    week = day - timedelta(days=day.weekday())
+    with transaction() as conn:
+        conn.execute("INSERT INTO progress (project_id, element, completed_percent, recorded_at, recorded_by) "
+                     "VALUES (?, ?, ?, ?, ?)", (project_id, element, completed_percent, recorded_at, recorded_by))
+        conn.execute("INSERT INTO progress_daily (project_id, element, day, completed_percent, updated_at) "
+                     "VALUES (?, ?, ?, ?, ?) ON CONFLICT (project_id, element, day) DO UPDATE SET "
+                     "completed_percent = excluded.completed_percent, updated_at = excluded.updated_at",
+                     (project_id, element, day.isoformat(), completed_percent, recorded_at))
+        conn.execute("INSERT INTO progress_weekly (project_id, element, week, completed_percent) "
+                     "VALUES (?, ?, ?, ?) ON CONFLICT (project_id, element, week) DO UPDATE SET "
+                     "completed_percent = excluded.completed_percent",
+                     (project_id, element, week.isoformat(), completed_percent))
+
+
+# Latest reading for each element, read from the newest daily rollup row
+
+
+def latest_progress(project_id):
+    rows = get_connection().execute(
+        "SELECT daily.element, daily.completed_percent, daily.updated_at FROM progress_daily AS daily "
+        "JOIN (SELECT element, MAX(day) AS day FROM progress_daily WHERE project_id = ? GROUP BY element) AS latest "
+        "ON latest.element = daily.element AND latest.day = daily.day WHERE daily.project_id = ?",
+        (project_id, project_id))
+    return {row["element"]: {"progress": row["completed_percent"], "last_updated": row["updated_at"]}
+            for row in rows}
+
+
+# Documents
+
+
+# Link stored content to a project. Returns None when the project already has that content.
+# Raises FileNotFoundError if a delete removed the content after it was stored, in which case
+# the caller stores it again.
+
+
+def add_document(project_id, document):
+    with transaction() as conn:
+        if not blob_store.exists(document["sha256"]):
+            raise FileNotFoundError(f"Content {document['sha256']} is no longer stored")
+        duplicate = conn.execute("SELECT 1 FROM documents WHERE project_id = ? AND sha256 = ?",
+                                 (project_id, document["sha256"])).fetchone()
+        if duplicate:
+            return None
+        cursor = conn.execute(
+            "INSERT INTO documents (project_id, name, type, size, sha256, category) VALUES (?, ?, ?, ?, ?, ?)",
+            (project_id, document["name"], document["type"], document["size"], document["sha256"],
+             document["category"]))
+        return cursor.lastrowid
+
+
+def list_documents(project_id):
+    rows = get_connection().execute(
+        "SELECT id, name, type, size, sha256, category FROM documents WHERE project_id = ? ORDER BY id",
+        (project_id,))
+    return [dict(row) for row in rows]
+
+
+def _document_content_used(conn, digest):
+    return conn.execute("SELECT 1 FROM documents WHERE sha256 = ? LIMIT 1", (digest,)).fetchone() is not None
+
+
+# Remove a document, and its stored content once no other document uses it
+
+
+def remove_document(document_id):
+    with transaction() as conn:
+        row = conn.execute("SELECT sha256 FROM documents WHERE id = ?", (document_id,)).fetchone()
+        conn.execute("DELETE FROM documents WHERE id = ?", (document_id,))
+    if row is not None and row["sha256"]:
+        _delete_unused_content([row["sha256"]])
+
+
+# Delete stored content that no document uses. The check and the delete both hold the write lock,
+# which add_document also holds while checking that the content it links is still there, so an
+# upload of the same content either links it first or stores it again.
+
+
+def _delete_unused_content(digests):
+    with transaction() as conn:
+        for digest in digests:
+            if not _document_content_used(conn, digest):
+                blob_store.delete(digest)
+
+
+# Financial totals. Claim amounts and counts are kept per project, client and the whole
+# portfolio, by payment month and status; budgets are stored under the "Budget" status.
+# Amounts are whole cents, each claim rounded once, so adding and removing a claim leaves
+# no floating-point residue behind.
+
+
+def _cents(amount):
+    return round((amount or 0) * 100)
+
+
+def _add_to_totals(conn, project_id, month, status, cents, count):
+    client = conn.execute("SELECT client_name FROM projects WHERE id = ?", (project_id,)).fetchone()[0] or ""
+    for scope, scope_key in (("project", str(project_id)), ("client", client), ("portfolio", "")):
+        conn.execute("INSERT INTO financial_totals (scope, scope_key, month, status, amount_cents, claim_count) "
+                     "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (scope, scope_key, month, status) DO UPDATE SET "
+                     "amount_cents = amount_cents + excluded.amount_cents, "
+                     "claim_count = claim_count + excluded.claim_count",
+                     (scope, scope_key, month, status, cents, count))
+
+
+def _remove_from_totals(conn, project_id):
+    rows = conn.execute("SELECT month, status, amount_cents, claim_count FROM financial_totals "
+                        "WHERE scope = 'project' AND scope_key = ?", (str(project_id),)).fetchall()
+    for row in rows:
+        _add_to_totals(conn, project_id, row["month"], row["status"], -row["amount_cents"], -row["claim_count"])
+    conn.execute("DELETE FROM financial_totals WHERE scope = 'project' AND scope_key = ?", (str(project_id),))
+
+
+def _claim_month(payment_schedule):
+    return str(payment_schedule or "")[:7]
+
+
+def get_financial_totals(scope, scope_key=""):
+    rows = get_connection().execute(
+        "SELECT month, status, amount_cents / 100.0 AS amount, claim_count FROM financial_totals "
+        "WHERE scope = ? AND scope_key = ?",
+        (scope, str(scope_key)))
+    return [dict(row) for row in rows]
+
+
+# Interim claims
+
+
+def _insert_claim(conn, project_id, claim):
+    cursor = conn.execute(
+        "INSERT INTO interim_claims (project_id, amount, status, payment_schedule, notes) VALUES (?, ?, ?, ?, ?)",
+        (project_id, claim["amount"], claim["status"], claim["payment_schedule"], claim.get("notes", "")))
+    _add_to_totals(conn, project_id, _claim_month(claim["payment_schedule"]), claim["status"],
+                   _cents(claim["amount"]), 1)
+    return cursor.lastrowid
+
+
+def add_claim(project_id, claim, changed_by=None):
+    with transaction() as conn:
+        conn.execute("UPDATE projects SET claims_version = claims_version + 1 WHERE id = ?", (project_id,))
+        claim_id = _insert_claim(conn, project_id, claim)
+        _log_event(conn, project_id, "claim", claim_id, "Created", None, claim["status"], f"${claim['amount']:.2f}",
+                   changed_by)
+        return claim_id
+
+
+# Claims in a batch are summed per project, month and status so the totals are updated once per group
+
+
+def bulk_add_claims(claims, changed_by=None):
+    totals = {}
+    for claim in claims:
+        group = (claim["project_id"], _claim_month(claim["payment_schedule"]), claim["status"])
+        cents, count = totals.get(group, (0, 0))
+        totals[group] = (cents + _cents(claim["amount"]), count + 1)
+    with transaction() as conn:
+        conn.executemany("UPDATE projects SET claims_version = claims_version + 1 WHERE id = ?",
+                         [(project_id,) for project_id in {claim["project_id"] for claim in claims}])
+        # Claims get consecutive IDs within the transaction, so the new ones are those past the old maximum
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM interim_claims").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO interim_claims (project_id, amount, status, payment_schedule, notes) VALUES (?, ?, ?, ?, ?)",
+            [(claim["project_id"], claim["amount"], claim["status"], claim["payment_schedule"],
+              claim.get("notes", "")) for claim in claims])
+        for (project_id, month, status), (cents, count) in totals.items():
+            _add_to_totals(conn, project_id, month, status, cents, count)
+        conn.execute(
+            "INSERT INTO audit_events (project_id, entity, entity_id, action, new_value, detail, changed_by, "
+            "changed_at) SELECT project_id, 'claim', id, 'Imported', status, printf('$%.2f', amount), ?, ? "
+            "FROM interim_claims WHERE id > ?", (changed_by, _now(), last_id))
+
+
+def list_claims(project_id):
+    rows = get_connection().execute(
+        "SELECT id, amount, status, payment_schedule, notes, version FROM interim_claims WHERE project_id = ? "
+        "ORDER BY id", (project_id,))
+    return [dict(row) for row in rows]
+
+
+def update_claim_status(claim_id, status, expected_version=None, changed_by=None):
+    with transaction() as conn:
+        claim = conn.execute(
+            "SELECT project_id, amount, status, payment_schedule, version FROM interim_claims WHERE id = ?",
+            (claim_id,)).fetchone()
+        if claim is None:
+            raise ConflictError(f"Claim {claim_id} was deleted by another user.")
+        if expected_version is not None and claim["version"] != expected_version:
+            raise ConflictError(f"Claim {claim_id} was changed by another user and is now {claim['status']}.")
+        if claim["status"] == status:
+            return claim["version"]
+        updated = conn.execute(
+            "UPDATE interim_claims SET status = ?, version = version + 1 WHERE id = ? AND version = ?",
+            (status, claim_id, claim["version"]))
+        if updated.rowcount == 0:
+            raise ConflictError(f"Claim {claim_id} was changed by another user.")
+        conn.execute("UPDATE projects SET claims_version = claims_version + 1 WHERE id = ?", (claim["project_id"],))
+        month = _claim_month(claim["payment_schedule"])
+        _add_to_totals(conn, claim["project_id"], month, claim["status"], -_cents(claim["amount"]), -1)
+        _add_to_totals(conn, claim["project_id"], month, status, _cents(claim["amount"]), 1)
+        _log_event(conn, claim["project_id"], "claim", claim_id, "Status Changed", claim["status"], status,
+                   f"${claim['amount']:.2f}", changed_by)
+        return claim["version"] + 1
+
+
+# Bumped whenever a project's claims change, to key cached claim tables
+
+
+def get_claims_version(project_id):
+    row = get_connection().execute("SELECT claims_version FROM projects WHERE id = ?", (project_id,)).fetchone()
+    return row[0] if row else None
+
+
+# Changes to anything a project report shows: its claims, tasks and progress readings
+
+
+def get_project_version(project_id):
+    row = get_connection().execute(
+        "SELECT claims_version, tasks_version, (SELECT COALESCE(MAX(id), 0) FROM progress WHERE project_id = ?) "
+        "FROM projects WHERE id = ?", (project_id, project_id)).fetchone()
+    return ".".join(str(part) for part in row) if row else None
+
+
+# Audit log
+
+
+# Events are only ever appended, in the same transaction as the change they record; triggers
+# refuse updates and deletes, so history outlives the rows it describes. Actions are "Created",
+# "Imported", "Status Changed", "Commented" and "Deleted", and "Recorded" for rows older than the log.
+
+
+def _now():
+    return datetime.now().isoformat(sep=" ", timespec="seconds")
+
+
+def _log_event(conn, project_id, entity, entity_id, action, old_value, new_value, detail, changed_by):
+    _log_events(conn, [(project_id, entity, entity_id, action, old_value, new_value, detail)], changed_by)
+
+
+def _log_events(conn, events, changed_by):
+    changed_at = _now()
+    conn.executemany(
+        "INSERT INTO audit_events (project_id, entity, entity_id, action, old_value, new_value, detail, changed_by, "
+        "changed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [event + (changed_by, changed_at) for event in events])
+
+
+# Events newest first, filtered by any of project, entity type, one entity and a time range
+# (since inclusive, until exclusive, as "YYYY-MM-DD[ HH:MM:SS]"). One record's trail uses the
+# (entity, entity_id) index, a project the (project_id, changed_at) one, a record type the
+# (entity, changed_at) one and the whole portfolio the changed_at one.
+
+
+EVENT_LIMIT = 1000
+
+
+def list_events(project_id=None, entity=None, entity_id=None, since=None, until=None, limit=EVENT_LIMIT):
+    filters = {
+        "project_id = ?": project_id,
+        "entity = ?": entity,
+        "entity_id = ?": entity_id,
+        "changed_at >= ?": since,
+        "changed_at < ?": until
+    }
+    conditions = [condition for condition, value in filters.items() if value is not None]
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = get_connection().execute(
+        "SELECT id, project_id, entity, entity_id, action, old_value, new_value, detail, changed_by, changed_at "
+        f"FROM audit_events {where} ORDER BY changed_at DESC, id DESC LIMIT ?",
+        [value for value in filters.values() if value is not None] + [limit])
+    return [dict(row) for row in rows]
@@ -0,0 +1,36 @@
+import pandas as pd
+
+import database
+from claims import CLAIM_STATUSES
+
+# Burn rate is the average approved amount per month over this many recent months
+BURN_RATE_MONTHS = 3
+
+
+# Summarize the running totals kept for a project, a client or the whole portfolio
+
+
+def load_summary(scope, scope_key=""):
+    rows = database.get_financial_totals(scope, scope_key)
+    budget = sum(row["amount"] for row in rows if row["status"] == "Budget")
+    claim_rows = pd.DataFrame([row for row in rows if row["status"] != "Budget"],
+                              columns=["month", "status", "amount", "claim_count"])
+    by_status = claim_rows.groupby("status")["amount"].sum().reindex(CLAIM_STATUSES, fill_value=0)
+    monthly = claim_rows[claim_rows["month"] != ""].pivot_table(
+        index="month", columns="status", values="amount", aggfunc="sum", fill_value=0)
+    monthly = monthly.reindex(columns=CLAIM_STATUSES, fill_value=0).sort_index()
+
+    current_month = pd.Timestamp.today().to_period("M")
+    recent_months = [str(current_month - offset) for offset in range(BURN_RATE_MONTHS)]
+    burn_rate = monthly["Approved"].reindex(recent_months, fill_value=0).sum() / BURN_RATE_MONTHS
+    remaining = budget - by_status["Approved"]
+    return {
+        "budget": budget,
+        "approved": by_status["Approved"],
+        "pending": by_status["Pending"],
+        "rejected": by_status["Rejected"],
+        "remaining": remaining,
+        "burn_rate": burn_rate,
+        "months_remaining": remaining / burn_rate if burn_rate > 0 else None,
+        "monthly": monthly
+    }
@@ -0,0 +1,72 @@
+import pandas as pd
+import plotly.express as px
+
+import database
+
+# Above this many tasks in the visible window, tasks are drawn as swimlanes
+DETAIL_LIMIT = 200
+
+SWIMLANE_COLUMNS = {"Assignee": "assigned_to", "Status": "status"}
+
+
+# Load a project's task dates. Tasks without a start date are drawn from their deadline.
+
+
+def load_timeline(project_id):
+    timeline = pd.read_sql_query(
+        "SELECT id, task_name, assigned_to, status, COALESCE(start_date, end_date) AS start, end_date AS finish "
+        "FROM tasks WHERE project_id = ?", database.get_connection(), params=(project_id,))
+    timeline["start"] = pd.to_datetime(timeline["start"], errors="coerce")
+    # A task runs to the end of its deadline day
+    timeline["finish"] = pd.to_datetime(timeline["finish"], errors="coerce") + pd.Timedelta(days=1)
+    timeline = timeline.dropna(subset=["start", "finish"])
+    timeline["assigned_to"] = timeline["assigned_to"].fillna("Unassigned")
+    return timeline
+
+
+def visible_tasks(timeline, window):
+    window_start, window_end = pd.Timestamp(window[0]), pd.Timestamp(window[1]) + pd.Timedelta(days=1)
+    return timeline[(timeline["start"] < window_end) & (timeline["finish"] > window_start)]
+
+
+# Count tasks active in each lane per period: +1 where a task starts, -1 after it ends,
+# then a running sum along the periods
+
+
+def summarize_lanes(tasks, lane_column, freq):
+    lanes = tasks[lane_column].to_numpy()
+    deltas = pd.concat([
+        pd.DataFrame({"lane": lanes, "period": tasks["start"].dt.to_period(freq), "delta": 1}),
+        pd.DataFrame({"lane": lanes, "period": (tasks["finish"] - pd.Timedelta(days=1)).dt.to_period(freq) + 1,
+                      "delta": -1})
+    ])
+    changes = deltas.groupby(["period", "lane"])["delta"].sum().unstack("lane", fill_value=0)
+    periods = pd.period_range(changes.index.min(), changes.index.max(), freq=freq)
+    active = changes.reindex(periods, fill_value=0).cumsum()
+    active.index.name = "period"
+    summary = active.stack().rename("active_tasks").reset_index()
+    summary = summary[summary["active_tasks"] > 0]
+    summary["start"] = summary["period"].dt.start_time
+    summary["finish"] = (summary["period"] + 1).dt.start_time
+    return summary
+
+
+# Build the timeline figure for a date window: one bar per task when few are visible,
+# otherwise weekly or monthly swimlanes shaded by how many tasks are active
+
+
+def build_gantt(timeline, window, swimlanes):
+    tasks = visible_tasks(timeline, window)
+    x_range = [pd.Timestamp(window[0]), pd.Timestamp(window[1]) + pd.Timedelta(days=1)]
+    if len(tasks) <= DETAIL_LIMIT:
+        fig = px.timeline(tasks, x_start="start", x_end="finish", y="task_name", color="status",
+                          hover_data=["assigned_to"],
+                          labels={"task_name": "Task", "status": "Status", "assigned_to": "Assigned To"})
+        fig.update_yaxes(autorange="reversed")
+    else:
+        freq = "M" if (x_range[1] - x_range[0]).days > 180 else "W"
+        summary = summarize_lanes(tasks, SWIMLANE_COLUMNS[swimlanes], freq)
+        fig = px.timeline(summary, x_start="start", x_end="finish", y="lane", color="active_tasks",
+                          labels={"lane": swimlanes, "active_tasks": "Active Tasks"})
+    fig.update_xaxes(range=x_range)
+    return fig, len(tasks)
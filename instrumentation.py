@@ -0,0 +1,111 @@
+import collections
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Profile every session when set; otherwise admins switch it on for their own session
+ALWAYS_ON = os.environ.get("CIVITAS_PROFILING") == "1"
+LOG_FILE = os.environ.get("CIVITAS_PROFILING_LOG", "profiling.log")
+LOG_MAX_BYTES = 5 * 1024 * 1024
+# Recent reruns of every session kept in memory for the percentiles
+HISTORY_SIZE = 1000
+
+_local = threading.local()
+_lock = threading.Lock()
+_history = collections.deque(maxlen=HISTORY_SIZE)
+
+
+# Profile one rerun of a page: timers inside it add to its record, which is kept in the
+# history and appended to the log as a JSON line. Does nothing when not enabled.
+
+
+@contextmanager
+def profile_rerun(page, user, count_widgets, enabled=True):
+    if not enabled:
+        yield None
+        return
+    record = {"time": datetime.now().isoformat(timespec="seconds"), "user": user, "page": page, "timings": {}}
+    _local.record = record
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _local.record = None
+        record["total_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        record["widgets"] = count_widgets()
+        with _lock:
+            _history.append(record)
+            _write_log(record)
+
+
+def _write_log(record):
+    if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > LOG_MAX_BYTES:
+        os.replace(LOG_FILE, LOG_FILE + ".1")
+    with open(LOG_FILE, "a") as log:
+        log.write(json.dumps(record) + "\n")
+
+
+# Add the time spent in a block to the current rerun's record under a name.
+# Outside a profiled rerun it costs one attribute lookup.
+
+
+@contextmanager
+def timer(name):
+    record = getattr(_local, "record", None)
+    if record is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        record["timings"][name] = round(record["timings"].get(name, 0) + elapsed, 3)
+
+
+def timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def recent_reruns(user=None):
+    with _lock:
+        return [record for record in _history if user is None or record["user"] == user]
+
+
+# Percentiles of every timed name, of the rerun totals per page and of the widget count
+# over the given reruns
+
+
+def percentiles(records):
+    samples = collections.defaultdict(list)
+    for record in records:
+        samples[f"rerun: {record['page']}"].append(record["total_ms"])
+        samples["widgets"].append(record["widgets"])
+        for name, elapsed in record["timings"].items():
+            samples[name].append(elapsed)
+    rows = []
+    for name, values in sorted(samples.items()):
+        values.sort()
+        rows.append({
+            "name": name,
+            "count": len(values),
+            "p50": _percentile(values, 50),
+            "p90": _percentile(values, 90),
+            "p99": _percentile(values, 99),
+            "max": values[-1]
+        })
+    return rows
+
+
+def _percentile(values, percent):
+    return values[min(len(values) - 1, len(values) * percent // 100)]
@@ -0,0 +1,46 @@
+import importlib
+import threading
+
+# Modules the dashboard pages need but the login screen does not
+HEAVY_MODULES = ["pandas", "plotly.express", "pyarrow.csv", "pyarrow.parquet", "fpdf",
+                 "claims", "financials", "gantt", "progress", "bulk", "reports", "thumbnails"]
+
+_lock = threading.Lock()
+_prewarm_started = False
+
+
+# Stand-in for a module that imports it on first attribute access
+
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attribute)
+
+
+def lazy(name):
+    return LazyModule(name)
+
+
+# Import the heavy modules in a background thread, once per process, so they are loaded by the
+# time a logged-in user opens a page. A page that gets there first waits on the import lock
+# instead of importing twice.
+
+
+def prewarm():
+    global _prewarm_started
+    with _lock:
+        if _prewarm_started:
+            return
+        _prewarm_started = True
+    threading.Thread(target=_import_all, name="prewarm-imports", daemon=True).start()
+
+
+def _import_all():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
@@ -0,0 +1,35 @@
+import pandas as pd
+
+import database
+
+BUILDING_ELEMENTS = ["Foundation", "Superstructure", "Roofing", "Finishes", "Electrical Work"]
+
+ROLLUPS = {
+    "Daily": ("progress_daily", "day", "D"),
+    "Weekly": ("progress_weekly", "week", "W-MON")
+}
+
+
+# Load a project's progress history from the daily or weekly rollup as one column per
+# element, carrying each element's last reading forward through periods without updates
+
+
+def load_trend(project_id, granularity="Daily"):
+    table, period_column, freq = ROLLUPS[granularity]
+    readings = pd.read_sql_query(
+        f"SELECT element, {period_column} AS period, completed_percent FROM {table} WHERE project_id = ?",
+        database.get_connection(), params=(project_id,))
+    if readings.empty:
+        return pd.DataFrame(columns=BUILDING_ELEMENTS)
+    readings["period"] = pd.to_datetime(readings["period"])
+    trend = readings.pivot(index="period", columns="element", values="completed_percent")
+    periods = pd.date_range(trend.index.min(), pd.Timestamp.today().normalize(), freq=freq)
+    trend = trend.reindex(trend.index.union(periods)).ffill().fillna(0)
+    return trend.reindex(columns=BUILDING_ELEMENTS, fill_value=0)
+
+
+# Overall progress per period as the average of the elements, giving the project's S-curve
+
+
+def s_curve(trend):
+    return trend.mean(axis=1).rename("Overall Progress (%)")
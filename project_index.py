@@ -0,0 +1,82 @@
+import threading
+
+import database
+
+
+# One version of the project list, by database ID and by name. Never changed once built,
+# so sessions read it without locking while a write builds its successor.
+
+
+class ProjectSnapshot:
+    def __init__(self, version, by_id, by_name):
+        self.version = version
+        self.by_id = by_id
+        self.by_name = by_name
+        self.names = list(by_name)
+
+
+# In-memory index of projects shared by all sessions. Register and delete swap in a new
+# snapshot with their change (copy-on-write); a change made elsewhere bumps projects_version
+# in the database and triggers a full reload on refresh().
+
+
+class ProjectIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = ProjectSnapshot(None, {}, {})
+
+    # The current snapshot, reloaded first if the projects changed in the database
+
+    def refresh(self):
+        version = database.get_projects_version()
+        if version != self._snapshot.version:
+            with self._lock:
+                self._reload(version)
+        return self._snapshot
+
+    def _reload(self, version):
+        by_id = {}
+        by_name = {}
+        for project in database.list_projects():
+            by_id[project["id"]] = project
+            by_name.setdefault(project["name"], project)
+        self._snapshot = ProjectSnapshot(version, by_id, by_name)
+
+    # Keep the index in step with our own write, or reload if another writer got in between
+    def _after_write(self, update):
+        version = database.get_projects_version()
+        snapshot = self._snapshot
+        if snapshot.version is not None and version == snapshot.version + 1:
+            by_id, by_name = dict(snapshot.by_id), dict(snapshot.by_name)
+            update(by_id, by_name)
+            self._snapshot = ProjectSnapshot(version, by_id, by_name)
+        else:
+            self._reload(version)
+
+    def register(self, project):
+        with self._lock:
+            project_id = database.add_project(project)
+            record = database.get_project(project_id)
+            self._after_write(lambda by_id, by_name: self._add(by_id, by_name, record))
+        return project_id
+
+    def delete(self, project_id, changed_by=None):
+        with self._lock:
+            database.delete_project(project_id, changed_by)
+            self._after_write(lambda by_id, by_name: self._remove(by_id, by_name, project_id))
+
+    @staticmethod
+    def _add(by_id, by_name, project):
+        by_id[project["id"]] = project
+        by_name.setdefault(project["name"], project)
+
+    @staticmethod
+    def _remove(by_id, by_name, project_id):
+        project = by_id.pop(project_id, None)
+        if project is not None and by_name.get(project["name"]) is project:
+            del by_name[project["name"]]
+            # A project it was shadowing under the same name takes its place
+            for other in by_id.values():
+                if other["name"] == project["name"]:
+                    by_name[other["name"]] = other
+                    break
@@ -0,0 +1,235 @@
+import calendar
+import concurrent.futures
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+
+from fpdf import FPDF
+
+import database
+import progress
+
+REPORT_DIR = "report_cache"
+MAX_WORKERS = 2
+# Failed jobs kept so their errors can be shown; finished ones are dropped once their file exists
+MAX_FAILED_JOBS = 50
+
+_lock = threading.Lock()
+_executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="reports")
+# Render jobs by report path, shared by every session
+_jobs = {}
+
+
+# Rendered reports are kept on disk under the project version they were built from,
+# so a report for an unchanged project is served without rendering it again
+
+
+def report_path(project_id, month):
+    version = database.get_project_version(project_id)
+    return os.path.join(REPORT_DIR, f"project-{project_id}-{month}-v{version}.pdf")
+
+
+# Each report renders in a fresh interpreter running this module. Forking the multithreaded
+# server is unsafe, and spawn or forkserver workers would re-import Streamlit's __main__, which
+# is App.py, and so run the whole app again.
+
+
+def _render_in_worker(project_id, month, path):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), str(project_id), month, path],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f"Report worker exited with {result.returncode}")
+    return path
+
+
+# Queue a report for rendering unless it is already on disk or on its way, and return its path
+
+
+def request_report(project_id, month):
+    path = report_path(project_id, month)
+    with _lock:
+        _prune_jobs()
+        job = _jobs.get(path)
+        if not os.path.exists(path) and (job is None or job.done()):
+            _jobs[path] = _executor.submit(_render_in_worker, project_id, month, path)
+    return path
+
+
+def _prune_jobs():
+    failed = []
+    for path, job in list(_jobs.items()):
+        if job.done():
+            if job.exception() is None:
+                del _jobs[path]
+            else:
+                failed.append(path)
+    for path in failed[:-MAX_FAILED_JOBS]:
+        del _jobs[path]
+
+
+# State of a requested report: "done", "running", "failed" with the reason, or "missing" when
+# its file is gone, as happens once a newer version of the report replaces it
+
+
+def report_status(path):
+    if os.path.exists(path):
+        return "done", None
+    with _lock:
+        job = _jobs.get(path)
+    if job is not None and not job.done():
+        return "running", None
+    if job is not None and job.exception() is not None:
+        return "failed", str(job.exception())
+    # The job may have finished between the two checks
+    return ("done", None) if os.path.exists(path) else ("missing", None)
+
+
+# Render one project's monthly progress claim and valuation report. Runs in a worker process.
+
+
+def render_report(project_id, month, path):
+    project = database.get_project(project_id)
+    year, month_number = (int(part) for part in month.split("-"))
+    month_end = f"{month}-{calendar.monthrange(year, month_number)[1]:02d}"
+    project_claims = database.list_claims(project_id)
+    month_claims = [claim for claim in project_claims if (claim["payment_schedule"] or "").startswith(month)]
+    approved_to_date = sum(claim["amount"] for claim in project_claims
+                           if claim["status"] == "Approved" and (claim["payment_schedule"] or "") <= month_end)
+    month_totals = {status: sum(claim["amount"] for claim in month_claims if claim["status"] == status)
+                    for status in ("Approved", "Pending", "Rejected")}
+    trend = progress.load_trend(project_id, "Weekly")
+    if not trend.empty:
+        trend = trend.loc[:month_end]
+    budget = project["budget"] or 0
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, _text(f"{project['name']} - Progress Claim & Valuation Report"), ln=1)
+    pdf.set_font("Arial", "", 11)
+    pdf.cell(0, 7, f"Reporting month: {calendar.month_name[month_number]} {year}", ln=1)
+
+    _heading(pdf, "Project Details")
+    _rows(pdf, [
+        ("Project Code", project["code"]),
+        ("Client", project["client"]),
+        ("Start Date", project["start_date"]),
+        ("End Date", project["end_date"]),
+        ("Budget", f"${budget:,.2f}")
+    ])
+
+    _heading(pdf, "Valuation")
+    _rows(pdf, [
+        ("Approved This Month", f"${month_totals['Approved']:,.2f}"),
+        ("Pending This Month", f"${month_totals['Pending']:,.2f}"),
+        ("Rejected This Month", f"${month_totals['Rejected']:,.2f}"),
+        ("Approved To Date", f"${approved_to_date:,.2f}"),
+        ("Remaining Budget", f"${budget - approved_to_date:,.2f}")
+    ])
+
+    _heading(pdf, "Claims This Month")
+    if month_claims:
+        widths = (35, 40, 30, 85)
+        pdf.set_font("Arial", "B", 10)
+        for width, label in zip(widths, ("Payment Date", "Amount ($)", "Status", "Notes")):
+            pdf.cell(width, 7, label, border=1)
+        pdf.ln()
+        pdf.set_font("Arial", "", 10)
+        for claim in month_claims:
+            values = (claim["payment_schedule"], f"{claim['amount']:,.2f}", claim["status"], claim["notes"] or "")
+            for width, value in zip(widths, values):
+                pdf.cell(width, 7, _text(value)[:48], border=1)
+            pdf.ln()
+    else:
+        pdf.cell(0, 7, "No claims scheduled for this month.", ln=1)
+
+    _heading(pdf, "Progress")
+    if trend.empty:
+        pdf.cell(0, 7, "No progress recorded by the end of this month.", ln=1)
+    else:
+        _element_bars(pdf, trend.iloc[-1])
+        _s_curve(pdf, progress.s_curve(trend))
+
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=REPORT_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        pdf.output(temp_path, "F")
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    # Older versions of this report are out of date now
+    for old_path in glob.glob(os.path.join(REPORT_DIR, f"project-{project_id}-{month}-v*.pdf")):
+        if old_path != path:
+            os.remove(old_path)
+    return path
+
+
+# fpdf's core fonts only cover Latin-1
+
+
+def _text(value):
+    return str(value).encode("latin-1", "replace").decode("latin-1")
+
+
+def _heading(pdf, title):
+    pdf.ln(4)
+    pdf.set_font("Arial", "B", 13)
+    pdf.cell(0, 9, title, ln=1)
+    pdf.set_font("Arial", "", 11)
+
+
+def _rows(pdf, rows):
+    for label, value in rows:
+        pdf.cell(55, 7, label)
+        pdf.cell(0, 7, _text(value), ln=1)
+
+
+# Latest completion of each building element as a horizontal bar
+
+
+def _element_bars(pdf, latest):
+    pdf.set_fill_color(46, 134, 193)
+    for element, percent in latest.items():
+        pdf.cell(45, 7, _text(element))
+        x, y = pdf.get_x(), pdf.get_y()
+        pdf.rect(x, y + 1.5, 100, 4)
+        if percent > 0:
+            pdf.rect(x, y + 1.5, percent, 4, "F")
+        pdf.set_x(x + 105)
+        pdf.cell(0, 7, f"{percent:.0f}%", ln=1)
+
+
+# Overall progress week by week, drawn as a line in a 0-100% frame
+
+
+def _s_curve(pdf, curve):
+    width, height = 170, 50
+    if pdf.get_y() + height + 15 > pdf.h - pdf.b_margin:
+        pdf.add_page()
+    pdf.ln(3)
+    pdf.set_font("Arial", "", 9)
+    pdf.cell(0, 5, "Overall progress (S-curve)", ln=1)
+    left, top = pdf.l_margin + 10, pdf.get_y() + 2
+    pdf.rect(left, top, width, height)
+    pdf.text(pdf.l_margin, top + 3, "100%")
+    pdf.text(pdf.l_margin + 3, top + height, "0%")
+    pdf.text(left, top + height + 5, curve.index[0].strftime("%Y-%m-%d"))
+    pdf.text(left + width - 18, top + height + 5, curve.index[-1].strftime("%Y-%m-%d"))
+    pdf.set_draw_color(46, 134, 193)
+    step = width / max(len(curve) - 1, 1)
+    points = [(left + i * step, top + height - height * value / 100) for i, value in enumerate(curve)]
+    for start, end in zip(points, points[1:]):
+        pdf.line(start[0], start[1], end[0], end[1])
+    pdf.set_draw_color(0, 0, 0)
+    pdf.set_y(top + height + 8)
+
+
+if __name__ == "__main__":
+    render_report(int(sys.argv[1]), sys.argv[2], sys.argv[3])
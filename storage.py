@@ -0,0 +1,16 @@
+import json
+
+# The portfolio as stored before the SQLite database: a plain list of projects. It is only read,
+# once, to seed an empty database.
+SNAPSHOT_FILE = "projects.json"
+
+
+# Load projects from JSON
+
+
+def load_portfolio():
+    try:
+        with open(SNAPSHOT_FILE, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,83 @@
+import re
+
+import database
+
+TOKEN_PATTERN = re.compile(r"\w+")
+# Shorter words are ignored: the prefix indexes start at two characters, and one letter matches nearly every task
+MIN_TOKEN_LENGTH = 2
+
+# Text matches are ranked among this many of the newest matching tasks, so a very
+# common word costs the same as a rare one
+RANK_CANDIDATES = 2000
+
+# Columns that free text is matched against; the others only hold filter values
+TEXT_COLUMNS = "{task_name description assigned_to comments}"
+
+TASK_COLUMNS = ("tasks.id, tasks.project_id, projects.project_title AS project_name, tasks.task_name, "
+                "tasks.assigned_to, tasks.priority, tasks.end_date AS deadline, tasks.status, tasks.description")
+
+
+def _phrase(text):
+    return '"' + str(text).replace('"', '""') + '"'
+
+
+# Turn free text into an FTS5 query that matches every word as a prefix of the text columns,
+# with the project, status and priority filters as column terms so FTS5 can intersect them
+
+
+def build_match_query(text, project_id=None, statuses=None, priorities=None):
+    terms = [f"{TEXT_COLUMNS}: {_phrase(token)}*" for token in TOKEN_PATTERN.findall(text.lower())
+             if len(token) >= MIN_TOKEN_LENGTH]
+    if not terms:
+        return ""
+    if project_id is not None:
+        terms.append(f"project_id:{_phrase(project_id)}")
+    if statuses:
+        terms.append(f"status:({' OR '.join(_phrase(status) for status in statuses)})")
+    if priorities:
+        terms.append(f"priority:({' OR '.join(_phrase(priority) for priority in priorities)})")
+    return " AND ".join(terms)
+
+
+# Search tasks across the portfolio. Text matches are ranked by bm25 over task name,
+# description, assignee and comments; without text, tasks are listed by deadline.
+
+
+def search_tasks(text="", project_id=None, statuses=None, priorities=None, deadline_range=None, limit=50):
+    connection = database.get_connection()
+    match_query = build_match_query(text, project_id, statuses, priorities)
+    if match_query:
+        conditions = ["task_search MATCH ?"]
+        params = [match_query]
+        if deadline_range:
+            conditions.append("tasks.end_date BETWEEN ? AND ?")
+            params.extend(str(day) for day in deadline_range)
+        sql = (f"SELECT {TASK_COLUMNS} FROM ("
+               "SELECT task_search.rowid AS task_id, task_search.rank AS score FROM task_search "
+               "JOIN tasks ON tasks.id = task_search.rowid "
+               f"WHERE {' AND '.join(conditions)} ORDER BY task_search.rowid DESC LIMIT ?"
+               ") AS matches JOIN tasks ON tasks.id = matches.task_id "
+               "JOIN projects ON projects.id = tasks.project_id ORDER BY matches.score, tasks.id LIMIT ?")
+        params.extend([RANK_CANDIDATES, limit])
+        return [dict(row) for row in connection.execute(sql, params)]
+
+    conditions = []
+    params = []
+    if project_id is not None:
+        conditions.append("tasks.project_id = ?")
+        params.append(project_id)
+    if statuses:
+        conditions.append(f"tasks.status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if priorities:
+        conditions.append(f"tasks.priority IN ({', '.join('?' * len(priorities))})")
+        params.extend(priorities)
+    if deadline_range:
+        conditions.append("tasks.end_date BETWEEN ? AND ?")
+        params.extend(str(day) for day in deadline_range)
+    sql = f"SELECT {TASK_COLUMNS} FROM tasks JOIN projects ON projects.id = tasks.project_id"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY tasks.end_date, tasks.id LIMIT ?"
+    params.append(limit)
+    return [dict(row) for row in connection.execute(sql, params)]
@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+# A fresh, empty database in a scratch working directory
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "_initialized", False)
+    database.forget_connections()
+    database.init_db()
+    yield database
+    database.get_connection().close()
+    database.forget_connections()
+
+
+@pytest.fixture
+def project_id(db):
+    return db.add_project({"name": "Test Project", "id": "TP01", "client": "Client", "start_date": "2025-01-01",
+                           "end_date": "2025-12-31", "budget": 1000.0})
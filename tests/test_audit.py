@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+
+def test_changes_are_logged_with_user(db, project_id):
+    task_id = db.add_task(project_id, {"task_name": "Pour slab", "assigned_to": "Ali", "priority": "High",
+                                       "start_date": "2025-01-01", "deadline": "2025-02-01", "status": "Pending",
+                                       "description": "Level 2"}, "ali")
+    db.add_comment(task_id, "check cover", "siti")
+    db.update_task_status(task_id, "Completed", None, "wong")
+    events = db.list_events(entity="task", entity_id=task_id)
+    assert [(event["action"], event["changed_by"]) for event in events] == [
+        ("Status Changed", "wong"), ("Commented", "siti"), ("Created", "ali")]
+    assert (events[0]["old_value"], events[0]["new_value"]) == ("Pending", "Completed")
+
+
+def test_log_is_append_only(db, project_id):
+    db.add_claim(project_id, {"amount": 10.0, "status": "Pending", "payment_schedule": "2025-03-01"}, "ali")
+    conn = db.get_connection()
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("UPDATE audit_events SET changed_by = 'someone else'")
+    conn.rollback()
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("DELETE FROM audit_events")
+    conn.rollback()
+
+
+def test_deleting_a_project_logs_its_tasks_and_claims(db, project_id):
+    claim_id = db.add_claim(project_id, {"amount": 10.0, "status": "Approved", "payment_schedule": "2025-03-01"})
+    db.add_task(project_id, {"task_name": "Survey", "assigned_to": "Raj", "priority": "Low",
+                             "start_date": "2025-01-01", "deadline": "2025-02-01", "status": "Pending",
+                             "description": "Site"})
+    db.delete_project(project_id, "admin")
+    deleted = db.list_events(project_id=project_id, since="2000-01-01")
+    assert {(event["entity"], event["action"], event["changed_by"]) for event in deleted[:2]} == {
+        ("task", "Deleted", "admin"), ("claim", "Deleted", "admin")}
+    assert db.list_events(entity="claim", entity_id=claim_id)[0]["old_value"] == "Approved"
+
+
+def test_history_queries_use_indexes(db):
+    queries = [
+        ("entity = ? AND entity_id = ?", ("claim", 1), "idx_audit_entity"),
+        ("project_id = ? AND changed_at >= ? AND changed_at < ?", (1, "2025-01-01", "2025-02-01"),
+         "idx_audit_project"),
+        ("entity = ? AND changed_at >= ? AND changed_at < ?", ("task", "2025-01-01", "2025-02-01"),
+         "idx_audit_entity_time"),
+        ("changed_at >= ? AND changed_at < ?", ("2025-01-01", "2025-02-01"), "idx_audit_time")
+    ]
+    for condition, params, index in queries:
+        plan = db.get_connection().execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM audit_events WHERE {condition} ORDER BY changed_at DESC, id DESC",
+            params).fetchall()
+        assert f"USING INDEX {index} " in plan[0]["detail"], (condition, plan[0]["detail"])
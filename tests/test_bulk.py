@@ -0,0 +1,23 @@
+import io
+
+import bulk
+
+
+def claims_csv(*amounts):
+    lines = ["project_code,amount,status,payment_schedule,notes"]
+    lines += [f"TP01,{amount},Pending,2025-03-01,note" for amount in amounts]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def test_non_finite_amounts_are_row_errors(db, project_id):
+    result = bulk.import_file(claims_csv("12.5", "nan", "inf", "-inf"), "Claims", "CSV", dry_run=True)
+    assert result["imported"] == 1
+    assert result["rejected"] == 3
+    assert result["errors"][0] == "Row 2: amount 'nan' is not a finite number"
+
+
+def test_dry_run_matches_import(db, project_id):
+    dry_run = bulk.import_file(claims_csv("10", "nan", "20"), "Claims", "CSV", dry_run=True)
+    result = bulk.import_file(claims_csv("10", "nan", "20"), "Claims", "CSV", changed_by="tester")
+    assert result == dry_run
+    assert sorted(claim["amount"] for claim in db.list_claims(project_id)) == [10.0, 20.0]
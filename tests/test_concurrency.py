@@ -0,0 +1,94 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+
+# Start a status update while another connection holds an uncommitted change to the same row,
+# then commit that change. The update read the row before the change, so it must be refused.
+
+
+def interleave(db, update, other_write):
+    other = sqlite3.connect(db.DB_FILE, timeout=30)
+    other.execute("BEGIN IMMEDIATE")
+    other.execute(*other_write)
+    outcome = {}
+
+    def run():
+        try:
+            outcome["version"] = update()
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            db.get_connection().close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(0.3)
+    other.commit()
+    other.close()
+    thread.join(30)
+    return outcome
+
+
+def test_task_update_refused_after_interleaved_write(db, project_id):
+    task_id = db.add_task(project_id, {"task_name": "Pour slab", "assigned_to": "Ali", "priority": "High",
+                                       "start_date": "2025-01-01", "deadline": "2025-02-01", "status": "Pending",
+                                       "description": "Level 2"})
+    outcome = interleave(db, lambda: db.update_task_status(task_id, "In Progress", 0, "first"),
+                         ("UPDATE tasks SET status = 'Completed', version = version + 1 WHERE id = ?", (task_id,)))
+
+    assert isinstance(outcome.get("error"), db.ConflictError)
+    task = db.list_tasks(project_id)[0]
+    assert (task["status"], task["version"]) == ("Completed", 1)
+    assert [event["action"] for event in db.list_events(entity="task", entity_id=task_id)] == ["Created"]
+
+
+def test_claim_update_refused_after_interleaved_write(db, project_id):
+    claim_id = db.add_claim(project_id, {"amount": 100.0, "status": "Pending", "payment_schedule": "2025-03-01"})
+    # The refused update must leave the totals as they were, so Rejected never appears
+    outcome = interleave(db, lambda: db.update_claim_status(claim_id, "Rejected", 0, "first"),
+                         ("UPDATE interim_claims SET status = 'Approved', version = version + 1 WHERE id = ?",
+                          (claim_id,)))
+
+    assert isinstance(outcome.get("error"), db.ConflictError)
+    claim = db.list_claims(project_id)[0]
+    assert (claim["status"], claim["version"]) == ("Approved", 1)
+    totals = {row["status"]: row for row in db.get_financial_totals("project", project_id)}
+    assert totals["Pending"]["claim_count"] == 1
+    assert "Rejected" not in totals
+
+
+def test_concurrent_updates_from_one_version_apply_once(db, project_id):
+    task_id = db.add_task(project_id, {"task_name": "Formwork", "assigned_to": "Siti", "priority": "Low",
+                                       "start_date": "2025-01-01", "deadline": "2025-02-01", "status": "Pending",
+                                       "description": "Columns"})
+    barrier = threading.Barrier(8)
+    outcomes = []
+
+    def run(status):
+        barrier.wait()
+        try:
+            outcomes.append(db.update_task_status(task_id, status, 0, status))
+        except db.ConflictError:
+            outcomes.append(None)
+        finally:
+            db.get_connection().close()
+
+    threads = [threading.Thread(target=run, args=(status,)) for status in ["In Progress", "Completed"] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert sorted(outcomes, key=lambda version: version or 0) == [None] * 7 + [1]
+    assert db.list_tasks(project_id)[0]["version"] == 1
+    assert len(db.list_events(entity="task", entity_id=task_id)) == 2
+
+
+def test_stale_version_is_refused(db, project_id):
+    claim_id = db.add_claim(project_id, {"amount": 5.0, "status": "Pending", "payment_schedule": "2025-03-01"})
+    assert db.update_claim_status(claim_id, "Approved", 0) == 1
+    with pytest.raises(db.ConflictError):
+        db.update_claim_status(claim_id, "Rejected", 0)
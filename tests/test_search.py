@@ -0,0 +1,35 @@
+import task_search
+
+
+def add_task(db, project_id, name, deadline="2025-02-01"):
+    return db.add_task(project_id, {"task_name": name, "assigned_to": "Ali", "priority": "High",
+                                    "start_date": "2025-01-01", "deadline": deadline, "status": "Pending",
+                                    "description": "Level 2"})
+
+
+def test_first_comment_on_a_task_is_searchable(db, project_id):
+    task_id = add_task(db, project_id, "Pour slab")
+    db.add_comment(task_id, "waterproofing membrane")
+    assert [task["id"] for task in task_search.search_tasks("membr")] == [task_id]
+
+
+def test_text_does_not_match_filter_columns(db, project_id):
+    add_task(db, project_id, "Pour slab")
+    assert task_search.search_tasks("high") == []
+    assert task_search.search_tasks("pend") == []
+
+
+def test_single_letters_are_ignored(db, project_id):
+    add_task(db, project_id, "Pour slab", "2025-03-01")
+    first = add_task(db, project_id, "Strip formwork", "2025-02-01")
+    assert task_search.build_match_query("s") == ""
+    assert task_search.build_match_query("s sl") == task_search.build_match_query("sl")
+    assert task_search.search_tasks("s")[0]["id"] == first
+
+
+def test_portfolio_listing_uses_deadline_index(db):
+    plan = db.get_connection().execute(
+        "EXPLAIN QUERY PLAN SELECT id FROM tasks ORDER BY end_date, id LIMIT 20").fetchall()
+    details = " ".join(row["detail"] for row in plan)
+    assert "idx_tasks_deadline" in details
+    assert "TEMP B-TREE" not in details
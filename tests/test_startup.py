@@ -0,0 +1,9 @@
+import benchmark
+
+
+# The login screen must render without the page libraries, within the startup budgets.
+# Runs the benchmark's startup check in a fresh interpreter.
+
+
+def test_startup_within_budget():
+    assert benchmark.check_startup() == []
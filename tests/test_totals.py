@@ -0,0 +1,27 @@
+def claim(amount, project_id=None):
+    return {"project_id": project_id, "amount": amount, "status": "Pending", "payment_schedule": "2025-03-01"}
+
+
+def totals_by_status(db, scope, scope_key=""):
+    return {row["status"]: row["amount"] for row in db.get_financial_totals(scope, scope_key)}
+
+
+def test_ten_cent_claims_total_exactly(db, project_id):
+    for _ in range(10):
+        db.add_claim(project_id, claim(0.1))
+    for scope, scope_key in (("project", project_id), ("client", "Client"), ("portfolio", "")):
+        assert totals_by_status(db, scope, scope_key)["Pending"] == 1.00
+
+
+def test_bulk_claims_total_exactly(db, project_id):
+    db.bulk_add_claims([claim(0.1, project_id) for _ in range(10)])
+    assert totals_by_status(db, "portfolio")["Pending"] == 1.00
+
+
+def test_moving_claims_leaves_no_remainder(db, project_id):
+    claim_ids = [db.add_claim(project_id, claim(0.1)) for _ in range(10)]
+    for claim_id in claim_ids:
+        db.update_claim_status(claim_id, "Approved")
+    totals = totals_by_status(db, "project", project_id)
+    assert totals["Pending"] == 0
+    assert totals["Approved"] == 1.00
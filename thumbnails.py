@@ -0,0 +1,202 @@
+import collections
+import concurrent.futures
+import io
+import os
+import tempfile
+import threading
+
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+import blob_store
+
+CACHE_DIR = "preview_cache"
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Longest side in pixels of each rendition
+SIZES = {"thumbnail": 256, "preview": 1024}
+MAX_WORKERS = 2
+GALLERY_COLUMNS = 6
+GALLERY_PAGE_SIZE = 24
+
+# Source kind of each previewable document, by MIME type and by file extension
+SOURCE_TYPES = {"application/pdf": "pdf", "image/png": "image", "image/jpeg": "image"}
+SOURCE_EXTENSIONS = {".pdf": "pdf", ".png": "image", ".jpg": "image", ".jpeg": "image"}
+
+_lock = threading.Lock()
+_executor = concurrent.futures.ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix="thumbnails")
+# Renders in progress by content hash
+_pending = {}
+# Cached files from least to most recently used, with their sizes; loaded from disk on first use
+_index = None
+_cache_bytes = 0
+
+
+# Renditions are stored by content hash, so a file uploaded to several projects is rendered once
+
+
+def cache_path(digest, rendition):
+    return os.path.join(CACHE_DIR, f"{digest}-{rendition}.jpg")
+
+
+def source_kind(document):
+    extension = os.path.splitext(document["name"])[1].lower()
+    return SOURCE_TYPES.get(document["type"]) or SOURCE_EXTENSIONS.get(extension)
+
+
+# Return the cached rendition of a document, or None after queueing a render for it
+
+
+def get(document, rendition):
+    path = cache_path(document["sha256"], rendition)
+    with _lock:
+        if _touch(path):
+            return path
+    request(document)
+    return None
+
+
+def is_pending(digest):
+    with _lock:
+        return digest in _pending
+
+
+# Queue a document's renditions for rendering in the background unless they are cached or on their way
+
+
+def request(document):
+    digest = document["sha256"]
+    with _lock:
+        if digest in _pending or all(_touch(cache_path(digest, rendition)) for rendition in SIZES):
+            return
+        _pending[digest] = _executor.submit(_render, digest, source_kind(document))
+
+
+# Mark a cached rendition as just used. Call with the lock held.
+
+
+def _touch(path):
+    _load_index()
+    if path not in _index:
+        return False
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        _forget(path)
+        return False
+    _index.move_to_end(path)
+    return True
+
+
+# Render the preview and then the thumbnail from it, so the source is decoded once
+
+
+def _render(digest, kind):
+    try:
+        image = _open_source(digest, kind)
+        if image is None:
+            image = _placeholder("PDF" if kind == "pdf" else "?")
+        for rendition, size in sorted(SIZES.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size))
+            _store(cache_path(digest, rendition), image)
+    finally:
+        with _lock:
+            _pending.pop(digest, None)
+
+
+# Open the source image at no more than preview size. JPEGs decode at reduced scale; a PDF
+# shows its first embedded JPEG, since Pillow cannot draw PDF pages. None if neither works.
+
+
+def _open_source(digest, kind):
+    if not blob_store.exists(digest) or os.path.getsize(blob_store.blob_path(digest)) == 0:
+        return None
+    try:
+        if kind == "pdf":
+            source = _first_embedded_jpeg(digest)
+            if source is None:
+                return None
+        else:
+            source = Image.open(blob_store.blob_path(digest))
+        preview_size = SIZES["preview"]
+        source.draft("RGB", (preview_size, preview_size))
+        image = ImageOps.exif_transpose(source).convert("RGB")
+        image.thumbnail((preview_size, preview_size))
+        return image
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def _first_embedded_jpeg(digest):
+    with blob_store.open_mapped(digest) as mapped:
+        marker = mapped.find(b"/DCTDecode")
+        start = mapped.find(b"stream", marker) if marker >= 0 else -1
+        if start < 0:
+            return None
+        start += len(b"stream")
+        start += 2 if mapped[start:start + 2] == b"\r\n" else 1
+        end = mapped.find(b"endstream", start)
+        if end < 0:
+            return None
+        return Image.open(io.BytesIO(mapped[start:end]))
+
+
+def _placeholder(label):
+    size = SIZES["preview"]
+    image = Image.new("RGB", (size * 3 // 4, size), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, image.width - 1, image.height - 1], outline=(160, 160, 160), width=8)
+    font = ImageFont.load_default(size // 5)
+    draw.text((image.width // 2, image.height // 2), label, fill=(46, 134, 193), font=font, anchor="mm")
+    return image
+
+
+# Write a rendition atomically and evict the least recently used ones beyond the size limit
+
+
+def _store(path, image):
+    global _cache_bytes
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            image.save(temp_file, "JPEG", quality=80)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    with _lock:
+        _load_index()
+        _forget(path)
+        _index[path] = os.path.getsize(path)
+        _cache_bytes += _index[path]
+        while _cache_bytes > CACHE_MAX_BYTES and len(_index) > 1:
+            oldest, size = _index.popitem(last=False)
+            _cache_bytes -= size
+            try:
+                os.remove(oldest)
+            except FileNotFoundError:
+                pass
+
+
+def _forget(path):
+    global _cache_bytes
+    size = _index.pop(path, None)
+    if size is not None:
+        _cache_bytes -= size
+
+
+# Rebuild the recency order from file modification times, which get() refreshes on every hit
+
+
+def _load_index():
+    global _index, _cache_bytes
+    if _index is not None:
+        return
+    entries = []
+    if os.path.isdir(CACHE_DIR):
+        for entry in os.scandir(CACHE_DIR):
+            if entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+    _index = collections.OrderedDict((path, size) for _, path, size in sorted(entries))
+    _cache_bytes = sum(_index.values())